@@ -1,92 +1,95 @@
 from langchain_groq import ChatGroq
 from langchain.agents import initialize_agent, AgentType
-from tools import tools
-from database import load_menu_data, menu_collection
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import START, MessagesState, StateGraph
+from tools import structured_tools, tools
+from config import AGENT_MODE
+from database import menu_catalog
+from prompts import compiled_prompt, message_text, prompt_stats
+from checkpoint import SQLiteCheckpointer
+from langgraph.graph import START, END, StateGraph
+from history import ChatState, HistoryPolicy
+from cart import cart_is_empty, describe_cart
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.prebuilt import ToolNode, tools_condition
+from router import fast_path
+from response_cache import answered_from_menu, response_cache
 from langchain_google_genai import ChatGoogleGenerativeAI
+from llm_scheduler import LLM_CALL_TIMEOUT, ScheduledChatModel
+from model_tiers import FAST_MODEL, STRONG_MODEL, EscalateTurn, classify_turn, react_turn_cart, tier_for_step, tier_stats
+import time
 
 
-# Load menu data at startup
-full_menu, menu_by_category = load_menu_data()
-
-menu_text = "\n".join([ # This block just formats the menu items for the agent to use
-    f"- {item['name']} ({item['category']}): ${item['price']:.2f}"
-    for item in full_menu
-]) 
-
-
-
-prompt_template = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            "You are a helpful AI assistant managing a shopping cart. "
-            "The current menu includes the following items:\n\n" +
-            menu_text +
-            "\n\nYou should use this knowledge to answer questions about the menu. "
-            "Always use get_menu_item to search for menu items. "
-            "When adding an item with modifications, ensure the modifications are valid. "
-            "IMPORTANT: Allways use JSON formatting when taking an action"
-            "If a user adds an entree, kindly ask if they would like to make it a combo after adding the entree."
-            "Do not make assumptions about what the items the user wants when making a combo, if they do not tell you, ask them"
-            "When calling add_combo or remove_combo, the input should be one JSON object with three keys: entree, side, and drink. Each key should contain a dictionary with the item name and modifications. A fourth key, quantity, is optional, if not provided it defaults to one"
-            "When you remove items from the cart, in your response tell the user how many of the item were removed, dont just use the response from the function call"
-            "If, when prompted, a user agrees to make their order a combo, remove the elements of the combo they added and add them back as part of the combo, (but make sure the combo has all required elements. If it doesnt ask the user what they would like). When doing this you dont need to tell the user you removed anything, just that you added their order as a combo."          
-            "If the user asks about a menu item, look up the item using get_menu_item and answer based on its details."
-            "If the user wants to change an item in their cart, remove the item and add the new item, but be sure to check if the modifications are valid."
-            "IMPORTANT: when you use a tool, you must use the results"
-            "If a user query is unrelated to the menu, cart, or menu items, kindly inform them that you can only assist with menu, cart, or item related questions."
-            "When providing JSON outputs, return only the raw JSON without any additional formatting characters such as backticks or quotes. Do not wrap JSON responses in markdown or any other formatting."
-            "IMPORTANT: After each query from the user you must have a thought before you take an action or provide a response. Do not go straight to the action or response."
-            "IMPORTANT: Never use markdown or any other formatting characters for anything, namely thoughts, actions, action inputs, or jsons"
-            "IMPORTANT: With each request you will recieve the chat history, you should respond to each request only once."
-            "IMPORTANT: If you decide to make a call, you must actually make the call, do not create your own response."
-            "Do not add or remove anything without being explicitly told to do so."
-            "IMPORTANT: You are a helpful McDonald's cashier named Ronald, be sure to be polite but casual when appropriate. Avoid short answers like OK or Yes"
-            "IMPORTANT: Try to be as helpful as possible, and provide as much information as you can. for example if a user asks what is in their order, you should also tell them the price of the items as well as the total price of the order."
-            "After every Thought, you must either take an Action or immediately provide a Response."
-            "If an Action is required, use: Action: <action_name> If no Action is required, use: Final Answer: <your response>"
-            "Never leave a Thought without an Action or a Final Answer. If responding directly, skip 'Action' and use 'Final Answer' immediately."
-            "Never wrap thoughts in markdown or any other formatting characters."
-            "When calling view_cart, make sure to include the action input"
-            "IMPORTANT: If a function returns saying that the json formatting is bad, fix the input before you try again."
-            "IMPORTANT: JSON inputs should not include any formatting characters like quotes or backticks. Just the JSON itself."
-            "When displaying multiple items, try to format it in an easy to read manner, giving each item its own line."
-            "Try to sound as natural as possible, vary your responses, and avoid sounding robotic. Use contractions and casual language when appropriate."
-            "When asked about items like 'chicken dishes' or 'fish items', only include menu items that fit that description. Do not include items just because they share a category with other items that fit."
-            "Keep in mind some categories may not be good descriptors for the items in them, for example mcnuggets does not contain the word chicken, but the items in the category are chicken items. If you are unsure if a category contains items you are looking for, check the items in the category to see."
-            "If a user asks to clear their cart and add items in the same message, clear the cart first then add the items. When this happens let them know you cleared the cart and added the items they wanted."
-            "Anytime the user places their order, let them know what is in their cart and the total price first, then place the order",
-        ),
-        MessagesPlaceholder(variable_name="messages"),
-    ]
-)
-
-# Initialize the AI model
-llm = llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2
-) #This defines the AI model we are using, and sets temperature and max_retries. 
-  #Temperature defines how creative the AI is and retries is how many times it will try generating a response.
-
-# Create an AI Agent
-agent = initialize_agent(
-    tools=tools, # The list of tools we are giving it 
-    llm=llm,
-    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, # We use this type because we want the agent to think before it takes its action
-    verbose=True, # This makes the AI print its thoughts to console
-    handle_parsing_errors=True,  
-)
-
-def call_model(state: MessagesState):
-    prompt = prompt_template.invoke(state)
-    messages = prompt.to_messages()  # Convert the prompt to the required list format
-    result = agent.invoke(messages)
+# Nothing here talks to Mongo at import, the menu is loaded when the server starts (see startup.py)
+
+class ScheduledGemini(ScheduledChatModel, ChatGoogleGenerativeAI):
+    pass # Every async call waits its turn in llm_scheduler, which also owns the retries and deadlines
+
+def gemini(model):
+    return ScheduledGemini(
+        model=model,
+        temperature=0,
+        max_tokens=None,
+        timeout=LLM_CALL_TIMEOUT,
+        max_retries=1 # One attempt per scheduler attempt, the scheduler retries with backoff and knows the turn's deadline
+    ) #Temperature defines how creative the AI is, 0 keeps the answers predictable.
+
+# Initialize the AI models, simple turns go to the fast tier and everything else to the strong one (see model_tiers.py)
+tier_models = {"fast": gemini(FAST_MODEL), "strong": gemini(STRONG_MODEL)}
+
+# With native tool calling Gemini gets the typed tool schemas and the graph runs the tools it asks for (see below)
+tool_llms = {tier: model.bind_tools(structured_tools) for tier, model in tier_models.items()}
+
+def escalate_on_parse_error(error):
+    # The fast ReAct agent sent a reply we cant parse. Hand the turn to the strong agent, unless a tool already changed
+    # the cart this turn, running the turn again would then do that twice, so the fast agent gets the usual retry
+    if describe_cart() == react_turn_cart.get():
+        raise EscalateTurn() from error
+    return str(error.observation) if error.send_to_llm else "Invalid or incomplete response"
+
+# Create the AI Agents, only used when AGENT_MODE is "react"
+agents = {
+    tier: initialize_agent(
+        tools=tools, # The list of tools we are giving it 
+        llm=model,
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, # We use this type because we want the agent to think before it takes its action
+        verbose=True, # This makes the AI print its thoughts to console
+        handle_parsing_errors=escalate_on_parse_error if tier == "fast" else True,
+        return_intermediate_steps=True, # The response cache needs to know which tools the answer came from
+    )
+    for tier, model in tier_models.items()
+}
+
+# Older turns are folded into a summary so the prompt stays about the same size however long the conversation runs
+history_policy = HistoryPolicy(summarizer=tier_models["fast"], keep_turns=6, fold_every=4) # Summarizing is easy work
+
+async def compact_history(state: ChatState):
+    return await history_policy.apply(state)
+
+async def run_agent(tier, messages):
+    # Timed as one call per tier, for the ReAct agent that is the whole run including its tools
+    started = time.perf_counter()
+    try:
+        return await agents[tier].ainvoke(messages)
+    finally:
+        tier_stats.call(tier, time.perf_counter() - started)
+
+async def call_model(state: ChatState):
+    # The system prompt is only rendered when the menu changes, here we just put it in front of the history that fits the budget
+    cart = describe_cart()
+    cart_empty = cart_is_empty()
+    messages, usage = compiled_prompt("react").fit(state["messages"], summary=state.get("summary", ""), cart=cart)
+    prompt_stats.record(usage)
+
+    tier, reason = classify_turn(state["messages"][-1].content)
+    tier_stats.turn(tier, reason)
+    token = react_turn_cart.set(cart)
+    try:
+        try:
+            result = await run_agent(tier, messages) # Awaiting here lets the server handle other conversations while Gemini and the tools are working
+        except EscalateTurn as e:
+            tier_stats.escalated(e.reason)
+            result = await run_agent("strong", messages)
+    finally:
+        react_turn_cart.reset(token)
     
     # LangChain requires the response to be in a dict with role and content fields, our agent just returns output, so we format the response here for LangChain
     if isinstance(result, dict) and "input" in result and "output" in result:
@@ -107,13 +110,88 @@ def call_model(state: MessagesState):
                 formatted.append({"role": "assistant", "content": str(r)})
     else:
         formatted = [{"role": "assistant", "content": str(result)}]
+
+    steps = result.get("intermediate_steps", []) if isinstance(result, dict) else []
+    if len(formatted) == 1 and answered_from_menu(state["messages"][:-1], state.get("summary", ""), cart_empty, [action.tool for action, _ in steps]):
+        response_cache.put(state["messages"][-1].content, formatted[0]["content"])
     
     return {"messages": formatted}
 
 
-workflow = StateGraph(state_schema=MessagesState) 
-workflow.add_edge(START, "model")
-workflow.add_node("model", call_model)
+def current_turn_messages(messages):
+    # The customer's latest message and everything after it
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return messages[index:]
+    return messages
+
+async def ask_model(tier, messages):
+    started = time.perf_counter()
+    try:
+        return await tool_llms[tier].ainvoke(messages)
+    finally:
+        tier_stats.call(tier, time.perf_counter() - started)
+
+async def call_tool_model(state: ChatState):
+    # One step of the native tool calling loop. The reply either asks for tool calls, which the tools node runs before
+    # coming back here, or is the answer for the customer
+    turn = current_turn_messages(state["messages"])
+    tier, escalation = tier_for_step(turn)
+    if len(turn) == 1:
+        tier_stats.turn(*classify_turn(turn[0].content))
+    if escalation:
+        tier_stats.escalated(escalation)
+
+    cart_empty = cart_is_empty()
+    messages, usage = compiled_prompt("tools").fit(state["messages"], summary=state.get("summary", ""), cart=describe_cart())
+    prompt_stats.record(usage)
+    response = await ask_model(tier, messages)
+    if tier == "fast" and response.invalid_tool_calls and not response.tool_calls:
+        # Nothing usable in the reply, ask the strong model the same thing straight away
+        tier_stats.escalated("parse_error")
+        tier = "strong"
+        response = await ask_model(tier, messages)
+    response.response_metadata["tier"] = tier # Kept with the message, the rest of the turn stays on a tier once it escalated
+
+    if not response.tool_calls:
+        called = [call["name"] for message in turn if isinstance(message, AIMessage) for call in message.tool_calls]
+        earlier = state["messages"][:len(state["messages"]) - len(turn)]
+        if answered_from_menu(earlier, state.get("summary", ""), cart_empty, called):
+            response_cache.put(turn[0].content, message_text(response))
+
+    return {"messages": [response]}
+
+
+async def route_message(state: ChatState):
+    # Simple commands are answered by the router without calling the model, and menu questions the agent already
+    # answered for this menu come from the response cache. Everything else goes on to call_model
+    await menu_catalog.aensure_fresh()
+    reply = fast_path(state["messages"][-1].content)
+    if reply is None:
+        reply = response_cache.get(state["messages"][-1].content)
+    if reply is None:
+        return {}
+    return {"messages": [AIMessage(reply)]}
+
+def after_router(state: ChatState):
+    return END if isinstance(state["messages"][-1], AIMessage) else "history"
+
+
+workflow = StateGraph(state_schema=ChatState) 
+workflow.add_edge(START, "router")
+workflow.add_node("router", route_message)
+workflow.add_node("history", compact_history)
+workflow.add_conditional_edges("router", after_router, ["history", END])
+workflow.add_edge("history", "model")
+if AGENT_MODE == "react":
+    workflow.add_node("model", call_model)
+else:
+    # model -> tools -> model until the model answers without asking for a tool. The tools node runs all the calls
+    # from one reply concurrently, and a tool that raises becomes an error message for the model instead of a failed turn
+    workflow.add_node("model", call_tool_model)
+    workflow.add_node("tools", ToolNode(structured_tools))
+    workflow.add_conditional_edges("model", tools_condition, ["tools", END])
+    workflow.add_edge("tools", "model")
 
-memory = MemorySaver()
+memory = SQLiteCheckpointer("checkpoints.db") # Conversations are kept on disk, only the latest checkpoint of active threads stays in memory
 app = workflow.compile(checkpointer=memory)# all of this workflow stuff lets LangChain manage the memory for us
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Sales rollups. Every batch the order writer stores is also added to a few small documents in the sales_rollups
+collection, one per hour, one per day and one running total, so /analytics/sales reads a handful of documents
+instead of scanning every order.
+
+    python analytics.py --rebuild   recompute the rollups from the orders collection, one full scan
+
+The rebuild is only needed if a rollup update failed after its orders were stored (see OrderWriter._record), the
+order writer never adds an order to the rollups twice.
+"""
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from config import async_rollups_collection, orders_collection, rollups_collection
+from telemetry import mongo_span
+
+
+PERIODS = ("hour", "day")
+
+
+def _field(name):
+    # Item names become field names in the rollup documents, Mongo does not allow dots or a leading $ in those
+    return name.replace(".", "．").lstrip("$")
+
+
+def _bucket_starts(created_at):
+    # The start of the hour and the day an order falls in, as ISO strings in UTC so they sort and compare as text
+    when = datetime.fromisoformat(created_at) if created_at else datetime.now(timezone.utc)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    when = when.astimezone(timezone.utc)
+    hour = when.replace(minute=0, second=0, microsecond=0)
+    return {"hour": hour.isoformat(), "day": hour.replace(hour=0).isoformat()}
+
+
+def _combo_name(details):
+    return " + ".join(details[part]["name"] for part in ("entree", "side", "drink") if part in details)
+
+
+class Rollup:
+    # The counts for one bucket, built up in memory from a batch of orders and written with a single $inc
+    def __init__(self):
+        self.orders = 0
+        self.revenue_cents = 0
+        self.items = Counter()
+        self.combos = Counter()
+
+    def add(self, order):
+        self.orders += 1
+        self.revenue_cents += order.get("total_cents", 0)
+        for line in order.get("items", []):
+            if line.get("type") == "combo":
+                self.combos[_field(_combo_name(line.get("details", {})))] += line.get("quantity", 0)
+            else:
+                self.items[_field(line.get("name", "unknown"))] += line.get("quantity", 0)
+
+    def increments(self):
+        inc = {"orders": self.orders, "revenue_cents": self.revenue_cents}
+        inc.update({f"items.{name}": count for name, count in self.items.items()})
+        inc.update({f"combos.{name}": count for name, count in self.combos.items()})
+        return inc
+
+
+def rollups_for(orders):
+    # {(period, start): Rollup} for a batch of orders, plus ("total", None) for the running total
+    rollups = {}
+    for order in orders:
+        starts = _bucket_starts(order.get("created_at"))
+        for key in [(period, starts[period]) for period in PERIODS] + [("total", None)]:
+            rollups.setdefault(key, Rollup()).add(order)
+    return rollups
+
+
+def _rollup_id(period, start):
+    return "total" if period == "total" else f"{period}:{start}"
+
+
+class SalesRollups:
+    def __init__(self, collection, async_collection=None):
+        self.collection = collection
+        self.async_collection = async_collection # Reads for the endpoint, may come from a secondary
+        self._lock = threading.Lock()
+        self.stats = {"orders_rolled_up": 0, "updates": 0, "errors": 0, "last_error": None}
+
+    def record(self, orders):
+        # Adds a batch of newly stored orders to the rollups. A batch touches a few buckets at most, so this is a few
+        # small upserts however many orders it holds
+        if not orders:
+            return
+        rollups = rollups_for(orders)
+        try:
+            with mongo_span("rollup_orders"):
+                for (period, start), rollup in rollups.items():
+                    self.collection.update_one(
+                        {"_id": _rollup_id(period, start)},
+                        {"$inc": rollup.increments(), "$setOnInsert": {"period": period, "start": start}},
+                        upsert=True,
+                    )
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)
+            raise
+        with self._lock:
+            self.stats["orders_rolled_up"] += len(orders)
+            self.stats["updates"] += len(rollups)
+
+    def ensure_indexes(self):
+        self.collection.create_index([("period", 1), ("start", 1)], name="period_start")
+
+    def rebuild(self, orders_collection):
+        # Full scan of the orders, for maintenance only. Replaces every rollup with counts from the stored orders
+        rollups = rollups_for(orders_collection.find({}, {"created_at": 1, "total_cents": 1, "items": 1}))
+        self.collection.delete_many({})
+        for (period, start), rollup in rollups.items():
+            document = {"_id": _rollup_id(period, start), "period": period, "start": start, "orders": rollup.orders,
+                        "revenue_cents": rollup.revenue_cents, "items": dict(rollup.items), "combos": dict(rollup.combos)}
+            self.collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+        return len(rollups)
+
+    async def sales(self, period="hour", since=None, limit=48):
+        # The newest buckets for the period, oldest first, and the running total. since is an ISO timestamp
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        query = {"period": period}
+        if since:
+            query["start"] = {"$gte": _bucket_starts(since)[period]}
+        with mongo_span("sales_rollups"):
+            buckets = await self.async_collection.find(query, {"_id": 0}).sort("start", -1).limit(limit).to_list(length=limit)
+            total = await self.async_collection.find_one({"_id": "total"}, {"_id": 0, "period": 0, "start": 0})
+        buckets.reverse()
+        return {
+            "period": period,
+            "buckets": [_with_revenue(bucket) for bucket in buckets],
+            "total": _with_revenue(total or {"orders": 0, "revenue_cents": 0, "items": {}, "combos": {}}),
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+def _with_revenue(document):
+    document.setdefault("items", {})
+    document.setdefault("combos", {})
+    document["revenue"] = round(document.get("revenue_cents", 0) / 100, 2)
+    return document
+
+
+sales_rollups = SalesRollups(rollups_collection, async_rollups_collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="recompute every rollup from the orders collection")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    sales_rollups.ensure_indexes()
+    print("Rebuilt", sales_rollups.rebuild(orders_collection), "rollups")
+
+
+if __name__ == "__main__":
+    main()
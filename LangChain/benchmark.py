@@ -0,0 +1,269 @@
+"""
+End to end benchmark for the chat server. Runs main.fastapi_app in process against the in-memory Mongo stand-in
+seeded from menu.py, with a scripted chat model in place of Gemini, so the numbers only measure our own code.
+
+    python benchmark.py --sessions 50 --concurrency 1 4 16 --output benchmark.json
+
+Prints one JSON document with /chat latency percentiles per concurrency level, tool throughput and memory per
+session. Compare the files between releases to catch regressions.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from typing import ClassVar
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Set before anything imports config.py
+os.environ["MONGO_BACKEND"] = "memory"
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+import uuid
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+import langchain_google_genai
+from sessions import current_session
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Stands in for Gemini. Each session has a queue of steps that the benchmark fills before every turn, so the
+    agent takes the same steps on every run whatever order concurrent sessions run in. Steps are written as ReAct
+    text or as native tool calls depending on AGENT_MODE. An empty queue, or the history summarizer, gets a plain
+    final answer.
+    """
+
+    plans: ClassVar[dict] = {}       # session id -> deque of replies for the current turn
+    latency: ClassVar[float] = 0.0   # seconds to wait per call, to model the time Gemini would take
+    calls: ClassVar[int] = 0
+
+    def __init__(self, **kwargs):
+        super().__init__() # Ignores the Gemini settings agent.py passes
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self # The plan already says which tool to call
+
+    def _next_reply(self):
+        from config import AGENT_MODE
+
+        ScriptedChatModel.calls += 1
+        plan = ScriptedChatModel.plans.get(current_session.get())
+        kind, *step = plan.popleft() if plan else final("Sure thing!")
+        if AGENT_MODE == "react":
+            if kind == "action":
+                message = AIMessage(f"Thought: I should use {step[0]}.\nAction: {step[0]}\nAction Input: {json.dumps(step[1])}")
+            else:
+                message = AIMessage(f"Thought: I have what I need.\nFinal Answer: {step[0]}")
+        elif kind == "action":
+            message = AIMessage("", tool_calls=[{"name": step[0], "args": step[1], "id": uuid.uuid4().hex}])
+        else:
+            message = AIMessage(step[0])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._next_reply()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._next_reply()
+
+
+def action(tool, tool_input):
+    return ("action", tool, tool_input)
+
+
+def final(text):
+    return ("final", text)
+
+
+COMBO = {"entree": {"item_name": "big mac"}, "side": {"item_name": "apple slices"}, "drink": {"item_name": "coca-cola"}}
+
+# One customer visit. Each turn is the message and the replies the model gives, turns with no replies are expected
+# to be answered by the router or the response cache
+SCENARIO = [
+    ("add 2 big macs", []),
+    ("What's in a Big Mac?", [action("get_menu_item", {"item_name": "big mac"}), final("Two beef patties, Big Mac sauce, lettuce, cheese and pickles.")]),
+    ("make one of them a combo with apple slices and a coke", [
+        action("remove_from_cart", {"item_name": "big mac", "quantity": 1}),
+        action("add_combo", COMBO),
+        final("Done, one Big Mac is now a combo with apple slices and a Coke."),
+    ]),
+    ("show my cart", []),
+    ("what drinks do you have?", [action("get_menu_item", {"category": "beverages"}), final("We have Coca-Cola, Sprite and Iced Coffee.")]),
+    ("that's everything, place my order", [action("view_cart", {}), action("place_order", {}), final("Your order is in!")]),
+]
+
+TOOL_INPUTS = {
+    "get_menu_item": {"item_name": "big mac"},
+    "view_cart": {},
+    "add_to_cart": {"item_name": "cheeseburger"},
+    "remove_from_cart": {"item_name": "cheeseburger"},
+    "add_items": {"items": [{"item_name": "cheeseburger", "quantity": 2}, {"item_name": "french fries (large)"}, {"item_name": "sprite", "modifications": ["no ice"]}]},
+    "remove_items": {"items": [{"item_name": "cheeseburger", "quantity": 2}, {"item_name": "french fries (large)"}, {"item_name": "sprite", "modifications": ["no ice"]}]},
+}
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(at(0.50) * 1000, 3),
+        "p95_ms": round(at(0.95) * 1000, 3),
+        "p99_ms": round(at(0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def run_session(client, session_id, latencies):
+    for message, replies in SCENARIO:
+        ScriptedChatModel.plans[session_id] = deque(replies) # Leftovers from a turn the cache answered are dropped here
+        started = time.perf_counter()
+        response = await client.post("/chat", json={"message": message, "session_id": session_id})
+        latencies.append(time.perf_counter() - started)
+        body = response.json()
+        if response.status_code != 200 or "error" in body:
+            raise RuntimeError(f"/chat failed for {message!r}: {body}")
+    ScriptedChatModel.plans.pop(session_id, None)
+
+
+async def run_load(client, prefix, sessions, concurrency):
+    latencies = []
+    queue = deque(f"{prefix}-{i}" for i in range(sessions))
+
+    async def worker():
+        while queue:
+            await run_session(client, queue.popleft(), latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency": percentiles(latencies),
+    }
+
+
+async def tool_throughput(iterations):
+    from sessions import bind_session
+    from tools import tools
+
+    results = {}
+    by_name = {tool.name: tool for tool in tools}
+    for name, tool_input in TOOL_INPUTS.items():
+        coroutine = by_name[name].coroutine
+        with bind_session(f"tools-{name}"):
+            await coroutine(json.dumps(tool_input)) # Warm up
+            started = time.perf_counter()
+            for _ in range(iterations):
+                await coroutine(json.dumps(tool_input))
+            elapsed = time.perf_counter() - started
+        results[name] = {"calls": iterations, "calls_per_second": round(iterations / elapsed, 1), "mean_us": round(elapsed / iterations * 1e6, 2)}
+    return results
+
+
+async def memory_per_session(client, sessions):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await run_load(client, "memory", sessions, 1)
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"sessions": sessions, "bytes_per_session": (after - before) // sessions, "peak_bytes": peak - before}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run(args):
+    import httpx
+    import main
+    from config import menu_collection
+    from database import menu_catalog
+    from menu import menu_data
+
+    menu_collection.insert_many([dict(item) for item in menu_data]) # insert_many adds _id to the dicts it is given
+    ScriptedChatModel.latency = args.llm_latency
+
+    results = {"started_at": time.time(), "revision": git_revision(), "python": platform.python_version(), "settings": vars(args)}
+    async with main.lifespan(main.fastapi_app):
+        while not menu_catalog.loaded:
+            await asyncio.sleep(0.01)
+        transport = httpx.ASGITransport(app=main.fastapi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await run_load(client, "warmup", 2, 1)
+            results["chat"] = [await run_load(client, f"load{level}", max(args.sessions, level), level) for level in args.concurrency]
+            results["tools"] = await tool_throughput(args.tool_iterations)
+            results["memory"] = await memory_per_session(client, args.memory_sessions)
+            results["model_calls"] = ScriptedChatModel.calls
+            results["stats"] = (await client.get("/stats")).json()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50, help="customer visits per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds each scripted model call takes")
+    parser.add_argument("--tool-iterations", type=int, default=2000)
+    parser.add_argument("--memory-sessions", type=int, default=50)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--agent-mode", choices=["tools", "react"], default=os.getenv("AGENT_MODE", "tools"))
+    parser.add_argument("--verbose", action="store_true", help="show the agent's and server's own output")
+    args = parser.parse_args()
+
+    os.environ["AGENT_MODE"] = args.agent_mode
+    langchain_google_genai.ChatGoogleGenerativeAI = ScriptedChatModel # Must happen before agent.py is imported
+    workdir = tempfile.mkdtemp(prefix="chat-benchmark-")
+    os.chdir(workdir) # Checkpoints, the order spool and the menu snapshot go here
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            results = asyncio.run(run(args))
+    finally:
+        os.chdir(HERE)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, default=str)
+    if args.output:
+        with open(os.path.join(HERE, args.output), "w", encoding="utf-8") as f: # An absolute path is used as it is
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,60 @@
-# Shopping Cart (Initially Empty)
 import json
-from database import get_menu_item
+from database import get_menu_item, get_menu_items, menu_catalog, menu_query_key
 from datetime import datetime, timezone
-from config import orders_collection
-
-
-
-shopping_cart = {}
+from order_queue import submit_order
+import asyncio
+from sessions import get_session
+from cart_model import COMBO_PARTS, Cart, combo_cents, format_cents, to_cents
+from tool_memo import turn_call
+from name_resolver import CONFIDENT_MATCH
+
+
+# Every function here works on the cart of the session making the current request (see sessions.py).
+# The session lock is held while the cart is read or changed, so two requests from the same customer cant interleave
+
+def _menu_match(item_name):
+    # The menu item a name refers to, preferring the exact name if the search matched several items. Goes through the
+    # turn's memo, so a get_menu_item call the agent just made for the same name is not repeated
+    query = {"item_name": item_name}
+    items = turn_call(menu_query_key(query), get_menu_item, query)
+    if not isinstance(items, list) or not items:
+        return None
+    return _best_match(item_name, items)
+
+def _best_match(item_name, items):
+    # The exact name if it is there, then whatever the name resolver is sure the name means ("fries" is the medium).
+    # Otherwise the customer has to say which item they meant, the first one comes back marked unsure with the others
+    exact = next((match for match in items if match["name"].lower() == item_name), None)
+    if exact is not None or len(items) == 1:
+        return exact or items[0]
+    resolved = menu_catalog.resolve(item_name, limit=1)
+    if resolved and resolved[0][1] >= CONFIDENT_MATCH:
+        match = next((match for match in items if match["name"] == resolved[0][0]["name"]), None)
+        if match is not None:
+            return {**match, "match_confidence": resolved[0][1]}
+    return {**items[0], "match_confidence": 0.0, "candidates": [match["name"] for match in items]}
+
+def _menu_modifications(item, modifications):
+    # The menu's spelling of each modification, so "No Ice" and "no ice" end up on the same cart line. Returns the
+    # sorted modifications and the ones the item does not offer, which are kept as they were typed
+    spelling = {modification.lower(): modification for modification in item.get("modifications", [])}
+    invalid = [modification for modification in modifications if modification.lower() not in spelling]
+    return tuple(sorted(spelling.get(modification.lower(), modification) for modification in modifications)), invalid
+
+# Ends every question the cart functions send back instead of changing the cart. A question is not a failed call,
+# tools.py tells the two apart by this
+CHECK_WITH_CUSTOMER = "Check with the customer before changing the cart."
+
+def _did_you_mean(item):
+    names = item.get("candidates", [item["name"]])
+    return names[0] if len(names) == 1 else ", ".join(names[:-1]) + f" or {names[-1]}"
+
+def _unsure(name, item):
+    # The question to ask instead of changing the cart when name only loosely matched item, or None if it is a sure match
+    confidence = item.get("match_confidence")
+    if confidence is not None and confidence < CONFIDENT_MATCH:
+        return f"{name} is not a menu item. Did you mean {_did_you_mean(item)}? {CHECK_WITH_CUSTOMER}"
+    return None
 
 def add_to_cart(args) -> str:
 
@@ -20,20 +68,29 @@ def add_to_cart(args) -> str:
     quantity = int(args.get("quantity", 1)) # Convert to integer
     modifications = tuple(sorted(args.get("modifications", [])))   # converts modifications to a tuple and sorts them
 
-    item = get_menu_item({"item_name": item_name}) # Fetch the item from the database
+    if quantity < 1:
+        return f"The quantity for {item_name} must be at least 1."
 
-    if not item: #If we cant find the item in the database
-        return f"Sorry, {item_name} is not available on the menu."
+    item = _menu_match(item_name) # Fetch the item from the database
 
-    cart_key = (item_name, modifications) # We use this instead of just name so that we can have multiple items with the same name but different modifications
+    if item is None: #If we cant find the item in the database
+        return f"Sorry, {item_name} is not available on the menu."
+    question = _unsure(item_name, item)
+    if question:
+        return question
 
-    if cart_key not in shopping_cart: # If the item is not in the cart we add it with quantity 0
-        shopping_cart[cart_key] = {"quantity": 0, "modifications": modifications}
+    modifications, _ = _menu_modifications(item, modifications)
+    unit_cents = to_cents(item["price"])
 
-    shopping_cart[cart_key]["quantity"] += quantity # If the item is in the cart we increase the quantity
+    session = get_session()
+    with session.lock:
+        # The cart is keyed on the menu item and modifications so that we can have multiple items with the same name but different modifications
+        line = session.cart.add_item(item["name"], modifications, quantity, unit_cents)
+        line_quantity, line_cents, total = line.quantity, line.line_cents, session.cart.total_cents
 
     mod_text = f" with {' and '.join(modifications)}" if modifications else "" # THis is for the response to the user, it adds the modifications to the response
-    return f"Added {quantity}x {item_name}(s){mod_text} to your cart."
+    return (f"Added {quantity}x {item['name']}(s){mod_text} to your cart at {format_cents(unit_cents)} each. "
+            f"You now have {line_quantity} for {format_cents(line_cents)}, cart total {format_cents(total)}.")
 
 def remove_from_cart(args) -> str:
 
@@ -46,77 +103,200 @@ def remove_from_cart(args) -> str:
     item_name = args.get("item_name", "").strip().lower()  # Convert to lowercase
     quantity = int(args.get("quantity", 1)) # Convert to integer
     modifications = tuple(sorted(args.get("modifications", []))) # Converts modifications to a tuple and sorts them
+    if quantity < 1:
+        return f"The quantity for {item_name} must be at least 1."
+
+    session = get_session()
+    with session.lock:
+        cart = session.cart
+
+        line = cart.item_line(item_name, modifications) # Looks the line up directly by name and modifications
+        if line is None:
+            item = _menu_match(item_name) # Lines are stored under the menu's name, which may be longer than what was asked for
+            question = _unsure(item_name, item) if item else None
+            if question:
+                return question
+            line = cart.item_line(item["name"], _menu_modifications(item, modifications)[0]) if item else None
+
+        if line is None: # If it cant find the item in the cart it will return this
+            return f"{item_name.capitalize()} with the specified modifications is not in your cart."
+
+        # Remove the item or decrease its quantity, the cart takes off at most what is there and keeps the total up to date
+        all_removed = line.quantity <= quantity
+        removed = cart.remove(line, quantity)
+        total = format_cents(cart.total_cents)
+        if all_removed: # THis is if we try to remove all of the item, or more than we have in the cart
+            return f"Removed all {removed} {line.name}(s) {modifications} from your cart. Cart total is now {total}."
+        else:
+            return f"Removed {removed}x {line.name}(s) {modifications} from your cart. Cart total is now {total}."
 
-    #  This block searches each item in the cart to find a matching item (Both name and modifications)
-    matching_key = None
-    for key in shopping_cart.keys():
-        if key[0].lower() == item_name and key[1] == modifications:
-            matching_key = key
-            break
-
-    if not matching_key: # If it cant find the item in the cart it will return this
-        return f"{item_name.capitalize()} with the specified modifications is not in your cart."
-
-    # Remove the item or decrease its quantity
-    if shopping_cart[matching_key]["quantity"] <= quantity: # THis is if we try to remove all of the item, or more than we have in the cart
-        del shopping_cart[matching_key]  
-        return f"Removed all {matching_key[0]}(s) {modifications} from your cart."
-    else:
-        shopping_cart[matching_key]["quantity"] -= quantity # This is if we only remove some of the item, but not all
-        return f"Removed {quantity}x {matching_key[0]}(s) {modifications} from your cart."
-
-
-def view_cart(args=None) -> dict:
-
-    if not shopping_cart:
-        return {"message": "Your shopping cart is empty."}
-
-    return {"cart": shopping_cart} # This just prints the shopping cart for the agent
-
-def add_combo(args) -> str:
-
+def _parse_lines(args, action):
+    # Shared by add_items and remove_items. Returns [(name, quantity, modifications)], or an error message for the agent
     try:
         if isinstance(args, str):
             args = json.loads(args.strip("`"))
     except json.JSONDecodeError:
-        return "Invalid JSON format for adding a combo."
+        return f"Invalid JSON format for {action} items."
+    entries = args.get("items", []) if isinstance(args, dict) else args # The ReAct agent sometimes sends just the list
+    if not isinstance(entries, list) or not entries:
+        return f"Please give a list of items for {action}."
+    try:
+        return [(entry.get("item_name", "").strip().lower(), int(entry.get("quantity", 1)), tuple(sorted(entry.get("modifications", []))))
+                for entry in entries]
+    except (AttributeError, TypeError, ValueError):
+        return f"Each item for {action} needs an item_name, and optionally a quantity and modifications."
+
+def _match_lines(lines):
+    # Looks every name up in one catalog pass. Returns {name: menu item or None}
+    names = sorted({name for name, _, _ in lines})
+    results = turn_call(("menu", "names", tuple(names)), get_menu_items, names)
+    return {name: _best_match(name, results[name]) if results[name] else None for name in names}
+
+def add_items(args) -> str:
+    # Adds several items in one call. Every item and modification is checked first, and nothing is added unless all of them are valid
+    lines = _parse_lines(args, "adding")
+    if isinstance(lines, str):
+        return lines
+
+    matches = _match_lines(lines)
+    problems, questions, spelled = [], [], []
+    for name, quantity, modifications in lines:
+        item = matches[name]
+        if item is None:
+            problems.append(f"{name} is not available on the menu")
+            continue
+        if _unsure(name, item):
+            questions.append(f"{name} is not a menu item, did you mean {_did_you_mean(item)}")
+            continue
+        if quantity < 1:
+            problems.append(f"the quantity for {name} must be at least 1")
+        modifications, invalid = _menu_modifications(item, modifications)
+        if invalid:
+            problems.append(f"{' and '.join(invalid)} is not a modification for {item['name']}")
+        spelled.append((name, quantity, modifications))
+    if problems:
+        return "Nothing was added: " + "; ".join(problems + questions) + "."
+    if questions:
+        return "Nothing was added: " + "; ".join(questions) + ". " + CHECK_WITH_CUSTOMER
+    lines = spelled
+
+    session = get_session()
+    with session.lock:
+        cart = session.cart
+        for name, quantity, modifications in lines:
+            item = matches[name]
+            cart.add_item(item["name"], modifications, quantity, to_cents(item["price"]))
+        total = cart.total_cents
+
+    added = ", ".join(f"{quantity}x {matches[name]['name']}" + (f" with {' and '.join(modifications)}" if modifications else "") for name, quantity, modifications in lines)
+    return f"Added {added} to your cart. Cart total {format_cents(total)}."
+
+def remove_items(args) -> str:
+    # Removes several items in one call. Nothing is removed unless every item is in the cart
+    lines = _parse_lines(args, "removing")
+    if isinstance(lines, str):
+        return lines
+
+    invalid = [name for name, quantity, _ in lines if quantity < 1]
+    if invalid:
+        return "Nothing was removed: " + "; ".join(f"the quantity for {name} must be at least 1" for name in invalid) + "."
+
+    matches = _match_lines(lines) # Lines are stored under the menu's name, which may be longer than what was asked for
+
+    session = get_session()
+    with session.lock:
+        cart = session.cart
+        targets, missing = {}, []
+        for name, quantity, modifications in lines:
+            line = cart.item_line(name, modifications)
+            if line is None and matches[name] and not _unsure(name, matches[name]):
+                line = cart.item_line(matches[name]["name"], _menu_modifications(matches[name], modifications)[0])
+            if line is None:
+                missing.append(f"{name} with {' and '.join(modifications)}" if modifications else name)
+            else:
+                targets[line.key] = (line, targets.get(line.key, (line, 0))[1] + quantity) # The same line asked for twice is removed once
+        if missing:
+            return "Nothing was removed, these are not in your cart: " + ", ".join(missing) + "."
+
+        removed = [(line, cart.remove(line, quantity)) for line, quantity in targets.values()]
+        total = cart.total_cents
+
+    text = ", ".join(f"{count}x {line.label()}" for line, count in removed)
+    return f"Removed {text} from your cart. Cart total is now {format_cents(total)}."
+
+
+def view_cart(args=None) -> str:
+
+    session = get_session()
+    with session.lock:
+        return session.cart.render() # Every line already has its price and the total is at the bottom, the agent can pass this straight on
+
+def describe_cart() -> str:
+    # Plain text version of the cart, it is put into the prompt every turn so the agent never works from an old cart
+    session = get_session()
+    with session.lock:
+        return session.cart.render()
+
+def cart_is_empty() -> bool:
+    session = get_session()
+    with session.lock:
+        return not session.cart
+
+def _parse_combo(args, action):
+    # Shared by add_combo and remove_combo, returns the parsed arguments or an error message for the agent
+    try:
+        if isinstance(args, str):
+            args = json.loads(args.strip("`"))
+    except json.JSONDecodeError:
+        return f"Invalid JSON format for {action} a combo."
+    return args
+
+def _combo_parts(args):
+    # Returns {part: (name, modifications)}, or None if one of the three parts is missing
+    parts = {}
+    for part in COMBO_PARTS:
+        data = args.get(part, {})
+        if not data: # ensures we have all 3 parts of a combo
+            return None
+        parts[part] = (data.get("item_name", "").strip().lower(), tuple(sorted(data.get("modifications", []))))
+    return parts
+
+def add_combo(args) -> str:
+
+    args = _parse_combo(args, "adding")
+    if isinstance(args, str):
+        return args
 
     # Check if all required combo keys are present
-    if "entree" not in args or "side" not in args or "drink" not in args:
+    if not all(part in args for part in COMBO_PARTS):
         return "Incomplete combo specification. Please provide an entree, a side, and a drink to form a combo."
 
-    quantity = int(args.get("quantity", 1))#We extract the items and their modifications as well as the quantity
-    entree_data = args.get("entree", {})
-    side_data = args.get("side", {})
-    drink_data = args.get("drink", {})
-
-    if not entree_data or not side_data or not drink_data: #ensures we have all 3 parts of a combo
+    quantity = int(args.get("quantity", 1)) # We extract the items and their modifications as well as the quantity
+    parts = _combo_parts(args)
+    if parts is None:
         return "Combo must include one entree, one side, and one drink."
+    if quantity < 1:
+        return "The quantity for the combo must be at least 1."
+
+    (entree_item_name, entree_mods), (side_item_name, side_mods), (drink_item_name, drink_mods) = (parts[part] for part in COMBO_PARTS)
+
+    # Fetch all three menu items in one lookup (Ensures they exist) so we can make sure they are the right types (entree, side, and drink)
+    names = [entree_item_name, side_item_name, drink_item_name]
+    results = turn_call(("menu", "names", tuple(names)), get_menu_items, names)
+
+    for part in COMBO_PARTS:
+        if not results[parts[part][0]]:
+            return f"{part.capitalize()} item '{parts[part][0]}' not found."
 
-    # Extract item names and modifications
-    entree_item_name = entree_data.get("item_name", "").strip().lower() #extract the name and modifications into separate variables
-    side_item_name = side_data.get("item_name", "").strip().lower()
-    drink_item_name = drink_data.get("item_name", "").strip().lower()
-    entree_mods = tuple(sorted(entree_data.get("modifications", [])))
-    side_mods = tuple(sorted(side_data.get("modifications", [])))
-    drink_mods = tuple(sorted(drink_data.get("modifications", [])))
-
-    # Fetch each menu item (Ensures they exist)
-    entree_result = get_menu_item({"item_name": entree_item_name}) # This has the agent query the menu so we can ensure we have the right items and make sure they are the right types (entree, side, and drink)
-    side_result = get_menu_item({"item_name": side_item_name})
-    drink_result = get_menu_item({"item_name": drink_item_name})
-
-    if not (isinstance(entree_result, list) and entree_result):
-        return f"Entree item '{entree_item_name}' not found."
-    if not (isinstance(side_result, list) and side_result):
-        return f"Side item '{side_item_name}' not found."
-    if not (isinstance(drink_result, list) and drink_result):
-        return f"Drink item '{drink_item_name}' not found."
-
-    # Extract the first matching item from each query result
-    entree_item = entree_result[0]#the result is returned as a list of all matching items, so we select the first (should be only one result as names are unique)
-    side_item = side_result[0]
-    drink_item = drink_result[0]
+    # The result is a list of all matching items, so we pick the one the customer most likely meant
+    entree_item = _best_match(entree_item_name, results[entree_item_name])
+    side_item = _best_match(side_item_name, results[side_item_name])
+    drink_item = _best_match(drink_item_name, results[drink_item_name])
+
+    for name, item in zip(names, (entree_item, side_item, drink_item)):
+        question = _unsure(name, item)
+        if question:
+            return question
 
     # Validate item types
     if entree_item.get("type", "").lower() != "entree":
@@ -127,123 +307,145 @@ def add_combo(args) -> str:
         return f"Item '{drink_item_name}' is not a drink."
 
     # Calculate combo price with a 10% discount
-    combo_price = (entree_item["price"] + side_item["price"] + drink_item["price"]) * 0.9
-
-    # Create a structured key for the combo
-    combo_key = (
-        "combo",
-        (entree_item_name, entree_mods),
-        (side_item_name, side_mods),
-        (drink_item_name, drink_mods),
-    ) #we use this to see if an instance of the combo is in the cart already
-
-    # Store only essential details in the shopping cart
-    if combo_key not in shopping_cart:
-        shopping_cart[combo_key] = {
-            "quantity": 0,
-            "items": {
-                "entree": {"name": entree_item_name, "modifications": entree_mods},
-                "side": {"name": side_item_name, "modifications": side_mods},
-                "drink": {"name": drink_item_name, "modifications": drink_mods},
-            },
-            "price_per_combo": combo_price,
-        }
+    combo_price = combo_cents(to_cents(entree_item["price"]), to_cents(side_item["price"]), to_cents(drink_item["price"]))
+    menu_parts = {part: (item["name"], parts[part][1]) for part, item in zip(COMBO_PARTS, (entree_item, side_item, drink_item))} # Stored under the menu's names, same as single items
 
-    shopping_cart[combo_key]["quantity"] += quantity # add the order to the cart
+    session = get_session()
+    with session.lock:
+        session.cart.add_combo(menu_parts, quantity, combo_price) # add the order to the cart
+        total = session.cart.total_cents
 
-    return (f"Added {quantity} combo(s) including {entree_item_name}, {side_item_name}, and {drink_item_name} "
-            f"with a 10% discount to your cart. Price per combo: ${combo_price:.2f}")
+    return (f"Added {quantity} combo(s) including {entree_item['name']}, {side_item['name']}, and {drink_item['name']} "
+            f"with a 10% discount to your cart. Price per combo: {format_cents(combo_price)}, cart total {format_cents(total)}")
 
 
 def remove_combo(args) -> str: # this is the same as add_combo, but instead of adding quantity we remove it, and if the resulting quantity is zero, we remove the entry from the cart
 
-    try:
-        if isinstance(args, str):
-            args = json.loads(args.strip("`"))
-    except json.JSONDecodeError:
-        return "Invalid JSON format for removing a combo."
+    args = _parse_combo(args, "removing")
+    if isinstance(args, str):
+        return args
 
     quantity = int(args.get("quantity", 1))
-    entree_data = args.get("entree", {})
-    side_data = args.get("side", {})
-    drink_data = args.get("drink", {})
-
-    if not entree_data or not side_data or not drink_data:
+    parts = _combo_parts(args)
+    if parts is None:
         return "Combo removal must include one entree, one side, and one drink."
-
-    # Extract details and modifications
-    entree_item_name = entree_data.get("item_name", "").strip().lower()
-    side_item_name = side_data.get("item_name", "").strip().lower()
-    drink_item_name = drink_data.get("item_name", "").strip().lower()
-    entree_mods = tuple(sorted(entree_data.get("modifications", [])))
-    side_mods = tuple(sorted(side_data.get("modifications", [])))
-    drink_mods = tuple(sorted(drink_data.get("modifications", [])))
-
-    # Build the combo key (same format as in add_combo)
-    combo_key = (
-        "combo",
-        (entree_item_name, entree_mods),
-        (side_item_name, side_mods),
-        (drink_item_name, drink_mods),
-    )
-
-    if combo_key not in shopping_cart:
-        return f"Combo including {entree_item_name}, {side_item_name}, and {drink_item_name} is not in your cart."
-
-    # Remove or decrease the combo quantity
-    if shopping_cart[combo_key]["quantity"] <= quantity:
-        del shopping_cart[combo_key]
-        return f"Removed all combos including {entree_item_name}, {side_item_name}, and {drink_item_name} from your cart."
-    else:
-        shopping_cart[combo_key]["quantity"] -= quantity
-        return f"Removed {quantity} combo(s) including {entree_item_name}, {side_item_name}, and {drink_item_name} from your cart."
+    if quantity < 1:
+        return "The quantity for the combo must be at least 1."
+
+    entree_item_name, side_item_name, drink_item_name = (parts[part][0] for part in COMBO_PARTS)
+
+    # add_combo stores the menu's names, so resolve what the agent sent the same way it did
+    names = [entree_item_name, side_item_name, drink_item_name]
+    results = turn_call(("menu", "names", tuple(names)), get_menu_items, names)
+    matched = {name: _best_match(name, results[name]) for name in names if results[name]}
+    parts = {part: (matched[name]["name"] if name in matched and not _unsure(name, matched[name]) else name, mods) for part, (name, mods) in parts.items()}
+
+    session = get_session()
+    with session.lock:
+        cart = session.cart
+        line = cart.combo_line(parts) # Combos are looked up by their three items and modifications
+
+        if line is None:
+            return f"Combo including {entree_item_name}, {side_item_name}, and {drink_item_name} is not in your cart."
+
+        # Remove or decrease the combo quantity
+        all_removed = line.quantity <= quantity
+        removed = cart.remove(line, quantity)
+        total = format_cents(cart.total_cents)
+        if all_removed:
+            return f"Removed all {removed} combos including {entree_item_name}, {side_item_name}, and {drink_item_name} from your cart. Cart total is now {total}."
+        else:
+            return f"Removed {removed} combo(s) including {entree_item_name}, {side_item_name}, and {drink_item_name} from your cart. Cart total is now {total}."
     
 
+def _take_order(session):
+    # Builds the order document from the session's cart and empties the cart. The items are handed back to the cart
+    # by _return_order if the order cant be saved, so the cart lock is never held while we wait on the disk
+    with session.lock:
+        cart = session.cart
+
+        if not cart:
+            return None, None
+
+        order_document = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "items": cart.order_items(),
+            "total_cents": cart.total_cents,
+        }
+
+        session.cart = Cart()
+        return order_document, cart
+
+def _return_order(session, taken_cart):
+    with session.lock:
+        session.cart.merge(taken_cart) # Anything added while we were saving stays in the cart too
+
 def place_order(args=None):
     """
-    Takes the current shopping_cart contents, builds an order document,
-    adds a timestamp, and inserts it into orders_collection.
+    Takes the current session's cart contents, builds an order document,
+    adds a timestamp, and hands it to the order queue, which writes it
+    to orders_collection in the background.
     """
     print("Starting order placement...")
 
-    if not shopping_cart:
+    session = get_session()
+    order_document, taken_cart = _take_order(session)
+    if order_document is None:
         return "Your cart is empty. Please add items before placing an order."
 
-    now = datetime.now(timezone.utc).isoformat()
+    try:
+        submit_order(order_document) # Returns once the order is saved to the local spool, Mongo is written in the background
+        print("Order queued:", order_document)
+        return "Order placed successfully! Here is what was ordered:\n" + taken_cart.render()
+    except Exception as e:
+        _return_order(session, taken_cart)
+        print("Error saving order:", e)
+        return f"Failed to place order: {str(e)}"
 
-    order_items = []
 
-    for key, value in shopping_cart.items():
-        if key == "created_at":
-            continue  # ignore any unexpected leftovers
+# Async versions for the async request path. Only the catalog refresh ever waits on Mongo,
+# everything else is an in-memory cart change, so the other tools just make sure the catalog is fresh first
 
-        item_data = {
-            "quantity": value["quantity"]
-        }
+async def aadd_to_cart(args) -> str:
+    await menu_catalog.aensure_fresh()
+    return add_to_cart(args)
 
-        # Regular item
-        if key[0] != "combo":
-            item_data["type"] = "item"
-            item_data["name"] = key[0]
-            item_data["modifications"] = list(key[1])
-        else:
-            item_data["type"] = "combo"
-            item_data["details"] = value["items"]
-            item_data["price_per_combo"] = value["price_per_combo"]
+async def aremove_from_cart(args) -> str:
+    await menu_catalog.aensure_fresh() # Removing looks names up in the menu too
+    return remove_from_cart(args)
+
+async def aadd_items(args) -> str:
+    await menu_catalog.aensure_fresh()
+    return add_items(args)
 
-        order_items.append(item_data)
+async def aremove_items(args) -> str:
+    await menu_catalog.aensure_fresh() # Removing looks names up in the menu too
+    return remove_items(args)
 
-    order_document = {
-        "created_at": now,
-        "items": order_items
-    }
+async def aview_cart(args=None) -> str:
+    return view_cart(args)
+
+async def aadd_combo(args) -> str:
+    await menu_catalog.aensure_fresh()
+    return add_combo(args)
+
+async def aremove_combo(args) -> str:
+    await menu_catalog.aensure_fresh() # Removing looks names up in the menu too
+    return remove_combo(args)
+
+async def aplace_order(args=None):
+    print("Starting order placement...")
+
+    session = get_session()
+    order_document, taken_cart = _take_order(session)
+    if order_document is None:
+        return "Your cart is empty. Please add items before placing an order."
 
     try:
-        orders_collection.insert_one(order_document)
-        print("Order inserted:", order_document)
-        # Optionally clear the cart here if you want
-        shopping_cart.clear()
-        return "Order placed successfully!"
+        await asyncio.to_thread(submit_order, order_document) # Saving to the spool waits on the disk, so keep it off the event loop
+        print("Order queued:", order_document)
+        return "Order placed successfully! Here is what was ordered:\n" + taken_cart.render()
     except Exception as e:
-        print("Error inserting order:", e)
+        _return_order(session, taken_cart)
+        print("Error saving order:", e)
         return f"Failed to place order: {str(e)}"
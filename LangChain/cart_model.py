@@ -0,0 +1,196 @@
+import sys
+
+COMBO_DISCOUNT_PERCENT = 10
+COMBO_PARTS = ("entree", "side", "drink")
+
+
+# All money is kept in integer cents so totals never pick up floating point rounding errors
+
+
+def to_cents(price):
+    return int(round(price * 100))
+
+
+def format_cents(cents):
+    return f"${cents // 100}.{cents % 100:02d}"
+
+
+def combo_cents(entree_cents, side_cents, drink_cents):
+    # The combo discount, rounded half up to the cent
+    full = entree_cents + side_cents + drink_cents
+    return (full * (100 - COMBO_DISCOUNT_PERCENT) + 50) // 100
+
+
+def _check_quantity(quantity):
+    # A zero or negative quantity would turn an add into a removal and the other way round, and can push totals below zero
+    if quantity < 1:
+        raise ValueError(f"quantity must be at least 1, got {quantity}")
+
+
+def item_id(name):
+    # Menu items are identified by their lowercase name. Interning means every cart holding a big mac shares one
+    # string, and comparing ids in the cart's dicts is a pointer check
+    return sys.intern(name.strip().lower())
+
+
+class ItemLine:
+    __slots__ = ("item_id", "name", "modifications", "quantity", "unit_cents", "line_cents")
+
+    def __init__(self, item_id, name, modifications, unit_cents, quantity=0):
+        self.item_id = item_id
+        self.name = name                    # the menu's spelling, for the rendered cart and the stored order
+        self.modifications = modifications  # sorted tuple, so the same changes in any order are the same line
+        self.quantity = quantity
+        self.unit_cents = unit_cents
+        self.line_cents = unit_cents * quantity
+
+    @property
+    def key(self):
+        return (self.item_id, self.modifications)
+
+    def label(self):
+        return self.name + (f" ({', '.join(self.modifications)})" if self.modifications else "")
+
+    def to_order(self):
+        return {
+            "type": "item",
+            "name": self.name,
+            "modifications": list(self.modifications),
+            "quantity": self.quantity,
+            "unit_cents": self.unit_cents,
+            "line_cents": self.line_cents,
+        }
+
+
+class ComboLine:
+    __slots__ = ("parts", "names", "quantity", "unit_cents", "line_cents")
+
+    def __init__(self, parts, names, unit_cents, quantity=0):
+        self.parts = parts                  # ((entree id, mods), (side id, mods), (drink id, mods)), the combo's signature
+        self.names = names                  # the menu's spelling of the three items, in the same order
+        self.quantity = quantity
+        self.unit_cents = unit_cents
+        self.line_cents = unit_cents * quantity
+
+    @property
+    def key(self):
+        return self.parts
+
+    def label(self):
+        return f"combo ({', '.join(self.names)})"
+
+    def to_order(self):
+        return {
+            "type": "combo",
+            "details": {part: {"name": name, "modifications": list(modifications)} for part, name, (_, modifications) in zip(COMBO_PARTS, self.names, self.parts)},
+            "quantity": self.quantity,
+            "unit_cents": self.unit_cents,
+            "line_cents": self.line_cents,
+            "price_per_combo": self.unit_cents / 100,
+        }
+
+
+def combo_signature(parts):
+    # parts is {"entree": (name, modifications), "side": ..., "drink": ...}
+    return tuple((item_id(parts[part][0]), parts[part][1]) for part in COMBO_PARTS)
+
+
+class Cart:
+    """
+    One customer's cart with prices kept up to date on every change. Each line stores its unit price and line total
+    in cents, and the cart total is adjusted by the difference on every add or remove, so rendering the cart or
+    placing the order never has to look prices up or add them up again.
+    Regular items are keyed on (item id, modifications) and combos on their signature, in separate dicts. by_item
+    maps an item id to the keys of its lines, so a line can be found by name without scanning the cart.
+    """
+
+    __slots__ = ("items", "combos", "by_item", "total_cents")
+
+    def __init__(self):
+        self.items = {}
+        self.combos = {}
+        self.by_item = {}
+        self.total_cents = 0
+
+    def __bool__(self):
+        return bool(self.items) or bool(self.combos)
+
+    def lines(self):
+        yield from self.items.values()
+        yield from self.combos.values()
+
+    def item_line(self, name, modifications):
+        return self.items.get((item_id(name), modifications))
+
+    def combo_line(self, parts):
+        return self.combos.get(combo_signature(parts))
+
+    def lines_for(self, name):
+        # Every regular line for the item, whatever its modifications
+        return [self.items[key] for key in self.by_item.get(item_id(name), ())]
+
+    def add_item(self, name, modifications, quantity, unit_cents):
+        _check_quantity(quantity)
+        key = (item_id(name), modifications)
+        line = self.items.get(key)
+        if line is None:
+            line = self.items[key] = ItemLine(key[0], name.strip(), modifications, unit_cents)
+            self.by_item.setdefault(key[0], set()).add(key)
+        self._change(line, quantity)
+        return line
+
+    def add_combo(self, parts, quantity, unit_cents):
+        _check_quantity(quantity)
+        signature = combo_signature(parts)
+        line = self.combos.get(signature)
+        if line is None:
+            line = self.combos[signature] = ComboLine(signature, tuple(parts[part][0].strip() for part in COMBO_PARTS), unit_cents)
+        self._change(line, quantity)
+        return line
+
+    def remove(self, line, quantity):
+        # Takes up to quantity off the line and drops it once it reaches zero, returns how many were actually removed
+        _check_quantity(quantity)
+        removed = min(quantity, line.quantity)
+        self._change(line, -removed)
+        if line.quantity <= 0:
+            self._drop(line)
+        return removed
+
+    def _drop(self, line):
+        if isinstance(line, ComboLine):
+            self.combos.pop(line.key, None)
+            return
+        self.items.pop(line.key, None)
+        keys = self.by_item.get(line.item_id)
+        if keys is not None:
+            keys.discard(line.key)
+            if not keys:
+                del self.by_item[line.item_id]
+
+    def _change(self, line, quantity):
+        line.quantity += quantity
+        line.line_cents += line.unit_cents * quantity
+        self.total_cents += line.unit_cents * quantity
+
+    def merge(self, other):
+        # Adds another cart's lines to this one, used to put an order back if it could not be saved
+        for line in other.items.values():
+            self.add_item(line.name, line.modifications, line.quantity, line.unit_cents)
+        for line in other.combos.values():
+            mine = self.combos.get(line.key)
+            if mine is None:
+                mine = self.combos[line.key] = ComboLine(line.parts, line.names, line.unit_cents)
+            self._change(mine, line.quantity)
+
+    def render(self):
+        # Compact, pre-totaled text the agent can pass straight on to the customer
+        if not self:
+            return "Your shopping cart is empty."
+
+        lines = [f"{line.quantity}x {line.label()} @ {format_cents(line.unit_cents)} = {format_cents(line.line_cents)}" for line in self.lines()]
+        lines.append(f"Total: {format_cents(self.total_cents)}")
+        return "\n".join(lines)
+
+    def order_items(self):
+        return [line.to_order() for line in self.lines()]
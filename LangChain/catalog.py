@@ -0,0 +1,320 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from name_resolver import NameResolver
+
+
+REFRESH_RETRY_SECONDS = 5 # First wait after a failed refresh, doubled on every failure after that
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class _MenuIndexes:
+    # One immutable snapshot of the menu and its lookup structures. A refresh builds a new one and swaps it in,
+    # so readers never see a half built index and never need to take a lock
+
+    def __init__(self, items, version):
+        self.items = items
+        self.version = version
+
+        self.by_name = {}       # lowercase name -> positions of every item whose name contains it, so exact names skip the substring scan
+        self.by_category = {}   # lowercase category -> positions of its items
+        self.names = []         # (lowercase name, position) pairs for substring searches
+        self.calories = []      # sorted calorie values, parallel to calorie_positions, so we can bisect for max_calories
+        self.calorie_positions = []
+
+        with_calories = []
+        for position, item in enumerate(items):
+            name = item.get("name", "").lower()
+            category = item.get("category", "Uncategorized").lower()
+            self.by_category.setdefault(category, []).append(position)
+            self.names.append((name, position))
+            if isinstance(item.get("calories"), (int, float)): # Mongo's $lte skips documents without a numeric calories field, so we do too
+                with_calories.append((item["calories"], position))
+
+        for name, _ in self.names:
+            if name not in self.by_name:
+                self.by_name[name] = [position for other, position in self.names if name in other]
+
+        with_calories.sort()
+        self.calories = [calories for calories, _ in with_calories]
+        self.calorie_positions = [position for _, position in with_calories]
+
+        self.resolver = NameResolver(items) # Typo tolerant lookups for names that are not a substring of any menu name
+
+
+def _scored(item, position, scores):
+    # Items found by the typo tolerant match come back with a match_confidence, so the agent can check with the
+    # customer before ordering something they may not have meant. The score comes from the same indexes as the item
+    if scores is None:
+        return item
+    return {**item, "match_confidence": scores.get(position, 0.0)}
+
+
+class MenuCatalog:
+    """
+    Process local copy of the menu collection with precomputed indexes for name, category and calorie lookups.
+    The catalog only goes back to Mongo when it has been invalidated, either because the TTL ran out and the
+    menu version changed, or because a change stream told us the collection was modified.
+    """
+
+    def __init__(self, loader, version_loader=None, ttl=300, async_loader=None, async_version_loader=None, snapshot_path=None):
+        self._loader = loader                   # returns (menu_items, menu_by_category), same as load_menu_data
+        self._version_loader = version_loader   # returns the current menu version, or None if the collection does not track one
+        self._async_loader = async_loader       # coroutine versions of the two above, used by the async request path
+        self._async_version_loader = async_version_loader
+        self._async_lock = None
+        self._snapshot_path = snapshot_path     # local copy of the last menu loaded from Mongo, lets a restart serve before Mongo answers
+        self._ttl = ttl
+        self._indexes = None
+        self.generation = 0                     # bumped on every reload, so things built from the menu know when to rebuild
+        self._checked_at = 0.0
+        self._stale = True
+        self._retry_at = 0.0                    # after a failed refresh the menu we have is served until then
+        self.refresh_failures = 0               # failed refreshes in a row, sets the backoff
+        self._lock = threading.Lock()           # only held while refreshing, lookups never touch it
+
+    @property
+    def loaded(self):
+        return self._indexes is not None # True once there is a menu to serve, from Mongo or the snapshot
+
+    @property
+    def version(self):
+        return self._current().version
+
+    def invalidate(self):
+        self._stale = True # The next lookup will reload from Mongo
+
+    def refresh(self):
+        with self._lock:
+            self._reload()
+        return self._indexes
+
+    def _reload(self):
+        self._stale = False # Cleared before loading so an invalidation that arrives mid reload is not lost
+        version = self._version_loader() if self._version_loader else None
+        menu_items, _ = self._loader()
+        self._install(menu_items, version)
+        self.save_snapshot(menu_items, version)
+
+    def _install(self, menu_items, version):
+        self._indexes = _MenuIndexes(menu_items, version)
+        self.generation += 1
+        self._checked_at = time.monotonic()
+        self.refresh_failures = 0
+        self._retry_at = 0.0
+
+    def _refresh_failed(self, error):
+        # Keeps serving the menu we have, Mongo being down should not take every lookup down with it. Tries again
+        # after a backoff that doubles with each failure, up to the TTL. Only raises if there is no menu at all
+        if self._indexes is None:
+            raise error
+        self.refresh_failures += 1
+        self._stale = True # The next attempt reloads in full
+        backoff = min(max(self._ttl, REFRESH_RETRY_SECONDS), REFRESH_RETRY_SECONDS * 2 ** (self.refresh_failures - 1))
+        self._retry_at = time.monotonic() + backoff
+        print(f"Menu refresh failed, serving the menu we have for another {backoff:.0f}s:", error)
+
+    def load_snapshot(self):
+        # Fills the catalog from the snapshot file if nothing is loaded yet. The snapshot counts as fresh for one TTL,
+        # so startup never waits on Mongo, call refresh in the background to replace it with the live menu
+        if not self._snapshot_path:
+            return False
+        try:
+            with open(self._snapshot_path, encoding="utf-8") as snapshot:
+                data = json.load(snapshot)
+            menu_items, version = data["items"], data.get("version")
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("Ignoring unreadable menu snapshot:", e)
+            return False
+
+        with self._lock:
+            if self._indexes is not None:
+                return False # The live menu got here first
+            self._stale = False
+            self._install(menu_items, version)
+        return True
+
+    def save_snapshot(self, menu_items, version):
+        if not self._snapshot_path:
+            return
+        temp_path = f"{self._snapshot_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as snapshot:
+                json.dump({"version": version, "saved_at": time.time(), "items": menu_items}, snapshot, default=str)
+            os.replace(temp_path, self._snapshot_path) # Readers only ever see a complete file
+        except OSError as e:
+            print("Could not save menu snapshot:", e) # Only costs us a slower next start
+
+    def _is_fresh(self):
+        if self._indexes is None:
+            return False
+        now = time.monotonic()
+        return now < self._retry_at or (not self._stale and now - self._checked_at < self._ttl)
+
+    def _current(self):
+        indexes = self._indexes
+        if self._is_fresh():
+            return indexes # Fast path, this is what almost every lookup hits
+        if indexes is not None and _on_event_loop():
+            return indexes # The async path refreshes with aensure_fresh, a sync reload here would block every request on Mongo
+
+        with self._lock:
+            if self._is_fresh():
+                return self._indexes # Another thread refreshed it while we were waiting
+            try:
+                if self._indexes is None or self._stale:
+                    self._reload()
+                else:
+                    # TTL ran out, if the menu tracks a version we only reload when it changed, otherwise we reload to be safe
+                    version = self._version_loader() if self._version_loader else None
+                    if version is None or version != self._indexes.version:
+                        self._reload()
+                    else:
+                        self._checked_at = time.monotonic()
+            except Exception as e:
+                self._refresh_failed(e)
+            return self._indexes
+
+    async def aensure_fresh(self):
+        # Async version of the staleness check in _current. Once this returns the sync lookups below hit the fast path,
+        # so async callers never block the event loop on Mongo
+        if self._is_fresh() or self._async_loader is None:
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        if self._indexes is not None and self._async_lock.locked():
+            return # One coroutine refreshes, the rest carry on with the menu we have instead of queueing behind it
+        async with self._async_lock:
+            if self._is_fresh():
+                return # Another coroutine refreshed it while we were waiting
+            try:
+                await self._arefresh()
+            except Exception as e:
+                self._refresh_failed(e)
+
+    async def _arefresh(self):
+        version_loader = self._async_version_loader
+        if self._indexes is not None and not self._stale:
+            version = await version_loader() if version_loader else None
+            if version is not None and version == self._indexes.version:
+                self._checked_at = time.monotonic()
+                return
+        self._stale = False
+        version = await version_loader() if version_loader else None
+        menu_items, _ = await self._async_loader()
+        self._install(menu_items, version)
+        await asyncio.to_thread(self.save_snapshot, menu_items, version)
+
+    def loaded_indexes(self):
+        # The indexes we have, without a freshness check. For code on the event loop after aensure_fresh has run, a
+        # sync refresh there would block every other request on Mongo
+        return self._indexes if self._indexes is not None else self._current()
+
+    async def afind(self, item_name="", category="", max_calories=None):
+        await self.aensure_fresh()
+        return self._find(self.loaded_indexes(), item_name, category, max_calories)
+
+    def all_items(self):
+        return self._current().items
+
+    def by_category(self):
+        indexes = self._current()
+        return {category: [indexes.items[p] for p in positions] for category, positions in indexes.by_category.items()}
+
+    def find(self, item_name="", category="", max_calories=None):
+        # Same matching rules as the old Mongo query: case insensitive substring on name, exact case insensitive
+        # category, and calories <= max_calories. Results come back in collection order
+        return self._find(self._current(), item_name, category, max_calories)
+
+    def _find(self, indexes, item_name, category, max_calories):
+        candidates = None
+        scores = None
+
+        if item_name:
+            if item_name in indexes.by_name:
+                candidates = set(indexes.by_name[item_name])
+            else:
+                candidates = {position for name, position in indexes.names if item_name in name}
+                if not candidates:
+                    scores = indexes.resolver.scored_matches(item_name) # "bigmac", "big mac burger", "big mca"
+                    candidates = set(scores)
+
+        if category:
+            positions = indexes.by_category.get(category, [])
+            candidates = set(positions) if candidates is None else candidates.intersection(positions)
+
+        if max_calories is not None:
+            end = bisect.bisect_right(indexes.calories, max_calories)
+            positions = indexes.calorie_positions[:end]
+            candidates = set(positions) if candidates is None else candidates.intersection(positions)
+
+        if candidates is None:
+            return list(indexes.items)
+
+        return [_scored(indexes.items[p], p, scores) for p in sorted(candidates)]
+
+    def find_names(self, names):
+        # Batch version of find for item names only, returns {name: matching items}. Exact names come straight from the
+        # name map and every other name is checked in one shared pass over the menu instead of one scan per name
+        return self._find_names(self._current(), names)
+
+    def _find_names(self, indexes, names):
+        results = {}
+        pending = []
+        for name in names:
+            if name in results:
+                continue
+            if name in indexes.by_name:
+                results[name] = [indexes.items[p] for p in indexes.by_name[name]]
+            else:
+                results[name] = []
+                if name:
+                    pending.append(name)
+
+        if pending:
+            for menu_name, position in indexes.names:
+                for name in pending:
+                    if name in menu_name:
+                        results[name].append(indexes.items[position])
+            for name in pending:
+                if not results[name]:
+                    scores = indexes.resolver.scored_matches(name)
+                    results[name] = [_scored(indexes.items[p], p, scores) for p in scores]
+
+        return results
+
+    def resolve(self, name, limit=3):
+        # The items a free text name most likely means, as (item, confidence) pairs best first
+        indexes = self._current()
+        return [(indexes.items[position], score) for score, position, _ in indexes.resolver.resolve(name, limit)]
+
+    async def afind_names(self, names):
+        await self.aensure_fresh()
+        return self._find_names(self.loaded_indexes(), names)
+
+    def watch(self, collection):
+        # Invalidates the catalog whenever the collection changes. Change streams need a replica set (Atlas always has one),
+        # if they are not available we just fall back to the TTL check
+        def run():
+            try:
+                with collection.watch() as stream:
+                    for _ in stream:
+                        self.invalidate()
+            except Exception as e:
+                print("Menu change stream stopped, falling back to TTL refresh:", e)
+
+        thread = threading.Thread(target=run, name="menu-change-stream", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,270 @@
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, WRITES_IDX_MAP, get_checkpoint_id, get_checkpoint_metadata
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """
+    Stores LangGraph checkpoints in a local SQLite file instead of process memory, so conversations survive a restart.
+    Only the latest checkpoint of each thread is kept (older ones are deleted as soon as a newer one is written),
+    the latest checkpoints of recently used threads are cached in memory, and threads nobody has touched for
+    idle_ttl seconds are deleted. Memory use therefore follows the number of active sessions, not every session ever.
+    """
+
+    def __init__(self, path="checkpoints.db", cache_size=1000, idle_ttl=24 * 3600, sweep_every=300, serde=None):
+        super().__init__(serde=serde)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None) # We open transactions ourselves
+        self._conn.execute("PRAGMA journal_mode=WAL")     # Readers dont wait for writers, and commits are one append
+        self._conn.execute("PRAGMA synchronous=NORMAL")   # Safe with WAL, only the last commits can be lost on power failure
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE INDEX IF NOT EXISTS checkpoints_updated_at ON checkpoints (updated_at);
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                task_path TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+        """)
+        self._lock = threading.Lock()   # One connection shared by every thread, so only one statement runs at a time
+        self._cache = OrderedDict()     # (thread_id, checkpoint_ns) -> latest checkpoint row, least recently used first
+        self._cache_size = cache_size
+        self._idle_ttl = idle_ttl
+        self._sweep_every = sweep_every
+        self._last_sweep = time.monotonic()
+
+    # Cache helpers, the cache holds serialized rows so every reader still gets its own copy of the checkpoint
+
+    def _cache_get(self, key):
+        row = self._cache.get(key)
+        if row is not None:
+            self._cache.move_to_end(key)
+        return row
+
+    def _cache_put(self, key, row):
+        self._cache[key] = row
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _build_tuple(self, thread_id, checkpoint_ns, row, writes):
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((value_type, value))) for task_id, channel, value_type, value in writes],
+        )
+
+    def _load_writes(self, thread_id, checkpoint_ns, checkpoint_id):
+        return self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        with self._lock:
+            key = (thread_id, checkpoint_ns)
+            cached = self._cache_get(key)
+            if cached is not None and (checkpoint_id is None or cached[0] == checkpoint_id):
+                return self._build_tuple(thread_id, checkpoint_ns, cached, []) # Cached rows never have pending writes, see put_writes
+
+            if checkpoint_id:
+                row = self._conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+
+            writes = self._load_writes(thread_id, checkpoint_ns, row[0])
+            if not writes and checkpoint_id is None:
+                self._cache_put(key, row)
+            return self._build_tuple(thread_id, checkpoint_ns, row, writes)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        conditions = []
+        params = []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            conditions.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                checkpoint_tuple = self._build_tuple(thread_id, checkpoint_ns, row, self._load_writes(thread_id, checkpoint_ns, row[0]))
+                if filter and not all(checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        row = (checkpoint["id"], parent_checkpoint_id, type_, serialized_checkpoint, metadata_type, serialized_metadata)
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, *row, time.time()),
+                )
+                # Compaction, the new checkpoint has everything the older ones had, so they and their writes can go
+                self._conn.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                    (thread_id, checkpoint_ns, checkpoint["id"]),
+                )
+                self._conn.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                    (thread_id, checkpoint_ns, checkpoint["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache_put((thread_id, checkpoint_ns), row)
+
+        if time.monotonic() - self._last_sweep > self._sweep_every:
+            self.expire_idle()
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, serialized, task_path))
+
+        # Special writes (errors, interrupts) replace what was there, normal writes are only saved once, same as MemorySaver
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._cache.pop((thread_id, checkpoint_ns), None) # The checkpoint now has pending writes, so it is read from disk until the next put
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("COMMIT")
+            for key in [key for key in self._cache if key[0] == thread_id]:
+                del self._cache[key]
+
+    def expire_idle(self):
+        # Deletes every thread whose latest checkpoint is older than idle_ttl. Returns how many threads were removed
+        cutoff = time.time() - self._idle_ttl
+        with self._lock:
+            self._last_sweep = time.monotonic()
+            threads = [row[0] for row in self._conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?", (cutoff,)
+            )]
+        for thread_id in threads:
+            self.delete_thread(thread_id)
+        return len(threads)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Async versions. SQLite calls are quick but can still wait on the disk, so they run in a worker thread,
+    # except for cache hits which are answered right away
+
+    async def aget_tuple(self, config):
+        if get_checkpoint_id(config) is None and self._lock.acquire(blocking=False): # Never wait for the lock on the event loop
+            try:
+                thread_id = config["configurable"]["thread_id"]
+                checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+                cached = self._cache_get((thread_id, checkpoint_ns))
+            finally:
+                self._lock.release()
+            if cached is not None:
+                return self._build_tuple(thread_id, checkpoint_ns, cached, [])
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        results = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in results:
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current, channel):
+        # Same version format as MemorySaver, so checkpoints stay compatible if we ever switch back
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
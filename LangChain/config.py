@@ -1,20 +1,39 @@
 import os
 from dotenv import load_dotenv
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 
-load_dotenv("API.env")
+load_dotenv("API.env") # Before the import below, connections.py reads its pool settings from the environment when it is imported
+from connections import ANALYTICS_READ_PREFERENCE, MENU_READ_PREFERENCE, MongoConnections
+
 uri = os.getenv("MONGODB_URI")
-client = MongoClient(uri, server_api=ServerApi('1'))
+
+# One connection manager for the whole process, see connections.py. MONGO_BACKEND=memory runs against an in-process
+# stand-in instead of Atlas. The collections below create the clients, so importing this module looks up the SRV record
+mongo = MongoConnections(uri, "Menu_DB", backend=os.getenv("MONGO_BACKEND", "atlas"))
+client = mongo.client
 db = client["Menu_DB"]
-menu_collection = db["menu"]
-orders_collection = db["orders"]
+menu_collection = mongo.collection("menu", MENU_READ_PREFERENCE)
+orders_collection = mongo.collection("orders")
+meta_collection = mongo.collection("meta", MENU_READ_PREFERENCE) # Holds small bookkeeping documents, like the menu version the catalog checks
+rollups_collection = mongo.collection("sales_rollups") # Hourly, daily and total sales, see analytics.py
+
+# Async client for the request path, so waiting on Mongo never ties up a worker thread. The sync client above is kept for scripts and startup
+async_client = mongo.async_client
+async_db = async_client["Menu_DB"]
+async_menu_collection = mongo.async_collection("menu", MENU_READ_PREFERENCE)
+async_orders_collection = mongo.async_collection("orders")
+async_meta_collection = mongo.async_collection("meta", MENU_READ_PREFERENCE)
+async_rollups_collection = mongo.async_collection("sales_rollups", ANALYTICS_READ_PREFERENCE)
 os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
 
+# "tools" runs the agent on Gemini's native function calling, "react" on the older text based ReAct agent
+AGENT_MODE = os.getenv("AGENT_MODE", "tools")
+
+# Sent as the X-Admin-Token header to read /traces. Without it set the endpoint is turned off
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 
-try:
-    client.admin.command('ping')
+def ping():
+    # Not run at import, a slow or unreachable cluster would hold up every process that imports this module.
+    # main.py runs it in the background at startup instead
+    mongo.ping()
     print("Pinged your deployment. Successfully connected to MongoDB!")
-except Exception as e:
-    print(e)
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+import pymongo
+from pymongo import ReadPreference
+from pymongo.server_api import ServerApi
+from motor.motor_asyncio import AsyncIOMotorClient
+from telemetry import mongo_timer
+
+
+# Every Mongo client in the process comes from here, so the pool settings and timeouts are decided in one place.
+# Defaults can be overridden from API.env, e.g. MONGO_MAX_POOL_SIZE=100
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+POOL_SETTINGS = {
+    "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),         # per client, the async and sync clients each get their own pool
+    "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 2),          # a couple of warm connections so the first request after a quiet spell doesnt pay for TLS
+    "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_MS", 300000),
+    "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_MS", 2000), # how long a request waits for a free connection before failing
+    "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_MS", 5000), # the driver default is 30 seconds
+    "connectTimeoutMS": _env_int("MONGO_CONNECT_MS", 5000),
+    "socketTimeoutMS": _env_int("MONGO_SOCKET_MS", 10000),
+    "retryReads": True,
+    "retryWrites": True,
+    "appname": "mcdonalds-ordering",
+}
+
+OPERATION_TIMEOUT_MS = _env_int("MONGO_OPERATION_MS", 3000) # Server side limit for each query on the request path, see max_time_ms in database.py
+PROBE_TIMEOUT_SECONDS = 2
+
+BACKENDS = ("atlas", "memory")
+
+
+class MongoConnections:
+    """
+    Owns the sync and async Mongo clients for one database. The clients are created on first use, which for the app is
+    when config.py is imported: a mongodb+srv URI is resolved with a DNS lookup right then, the connections themselves
+    are opened in the background. With backend="memory" both clients are replaced by an in-process mongomock database
+    shared between them, for tests and benchmarks that should not touch Atlas.
+    """
+
+    def __init__(self, uri, database, backend="atlas", settings=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown Mongo backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        self.uri = uri
+        self.database = database
+        self.backend = backend
+        self.settings = dict(POOL_SETTINGS if settings is None else settings)
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._health = {"ok": None, "latency_ms": None, "checked_at": None, "error": None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._connect()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._connect()
+        return self._async_client
+
+    def _connect(self):
+        with self._lock:
+            if self._client is not None:
+                return
+            if self.backend == "memory":
+                try:
+                    import mongomock
+                    import mongomock_motor
+                except ImportError:
+                    raise RuntimeError("MONGO_BACKEND=memory needs the mongomock and mongomock-motor packages") from None
+                client = mongomock.MongoClient()
+                self._async_client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=client)
+                self._client = client
+                return
+            listeners = [mongo_timer] # Times every wire command for /metrics
+            self._async_client = AsyncIOMotorClient(self.uri, server_api=ServerApi('1'), event_listeners=listeners, **self.settings)
+            self._client = pymongo.MongoClient(self.uri, server_api=ServerApi('1'), event_listeners=listeners, **self.settings)
+
+    def collection(self, name, read_preference=None):
+        collection = self.client[self.database][name]
+        return self._with_read_preference(collection, read_preference)
+
+    def async_collection(self, name, read_preference=None):
+        collection = self.async_client[self.database][name]
+        return self._with_read_preference(collection, read_preference)
+
+    def _with_read_preference(self, collection, read_preference):
+        # The stand-in is a single node, and mongomock_motor hands back a sync collection from with_options
+        if read_preference is None or self.backend == "memory":
+            return collection
+        return collection.with_options(read_preference=read_preference)
+
+    def ping(self, timeout=PROBE_TIMEOUT_SECONDS):
+        # Health probe, records the outcome and raises if the cluster did not answer in time
+        started = time.perf_counter()
+        try:
+            with pymongo.timeout(timeout):
+                self.client.admin.command("ping")
+        except Exception as e:
+            self._record(False, started, str(e))
+            raise
+        self._record(True, started, None)
+
+    def _record(self, ok, started, error):
+        self._health = {
+            "ok": ok,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "checked_at": time.time(),
+            "error": error,
+        }
+
+    def health(self):
+        # The outcome of the last probe plus the settings in use. ok is None until the first probe has run
+        return {
+            "backend": self.backend,
+            **self._health,
+            "pool": {"max_size": self.settings.get("maxPoolSize"), "min_size": self.settings.get("minPoolSize")},
+        }
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            if self._async_client is not None:
+                self._async_client.close()
+            self._client = self._async_client = None
+
+
+# Menu and meta documents are read far more than they change and a copy a moment old is fine, so they may come from a
+# secondary. Orders are written, so they stay on the primary
+MENU_READ_PREFERENCE = ReadPreference.SECONDARY_PREFERRED
+
+# Dashboards read the sales rollups, a few seconds behind is fine and keeps them off the primary
+ANALYTICS_READ_PREFERENCE = ReadPreference.SECONDARY_PREFERRED
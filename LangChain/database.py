@@ -1,12 +1,22 @@
 import json
-import re
-from config import menu_collection
+from catalog import MenuCatalog
+from config import menu_collection, meta_collection, async_menu_collection, async_meta_collection
+from connections import OPERATION_TIMEOUT_MS
+from telemetry import mongo_span
 
 
 
 def load_menu_data(): # This is not a tool used by the Agent, but we load the menu items and categories for it on startup to reduce the number of database calls
-    menu_items = list(menu_collection.find({}, {"_id": 0}))  # Exclude MongoDB `_id` field
+    with mongo_span("load_menu"):
+        menu_items = list(menu_collection.find({}, {"_id": 0}, max_time_ms=OPERATION_TIMEOUT_MS))  # Exclude MongoDB `_id` field
+    return menu_items, _group_by_category(menu_items)
 
+async def aload_menu_data(): # Same as load_menu_data but through the async client
+    with mongo_span("load_menu"):
+        menu_items = await async_menu_collection.find({}, {"_id": 0}, max_time_ms=OPERATION_TIMEOUT_MS).to_list(length=None)
+    return menu_items, _group_by_category(menu_items)
+
+def _group_by_category(menu_items):
     # Organize items by category for better readability
     menu_by_category = {}
     for item in menu_items:
@@ -15,9 +25,26 @@ def load_menu_data(): # This is not a tool used by the Agent, but we load the me
             menu_by_category[category] = []
         menu_by_category[category].append(item)
 
-    return menu_items, menu_by_category
+    return menu_by_category
 
-def get_menu_item(args) -> list:
+def get_menu_version(): # Returns the version stored with the menu, or None if nobody has set one
+    with mongo_span("menu_version"):
+        doc = meta_collection.find_one({"_id": "menu"}, {"version": 1}, max_time_ms=OPERATION_TIMEOUT_MS)
+    return doc.get("version") if doc else None
+
+async def aget_menu_version():
+    with mongo_span("menu_version"):
+        doc = await async_meta_collection.find_one({"_id": "menu"}, {"version": 1}, max_time_ms=OPERATION_TIMEOUT_MS)
+    return doc.get("version") if doc else None
+
+MENU_SNAPSHOT_PATH = "menu_snapshot.json" # Rewritten on every reload, the server boots from it while Mongo is still loading
+
+# All menu lookups are answered from this in-memory copy, Mongo is only queried again when the catalog is invalidated
+menu_catalog = MenuCatalog(load_menu_data, get_menu_version, async_loader=aload_menu_data, async_version_loader=aget_menu_version,
+                           snapshot_path=MENU_SNAPSHOT_PATH)
+
+def _parse_menu_query(args):
+    # Turns the agent's input into search filters, or returns an error message for the agent if the input is bad
 
     try:
         if isinstance(args, str):
@@ -30,26 +57,53 @@ def get_menu_item(args) -> list:
     category = args.get("category", "").strip().lower()
     max_calories = args.get("max_calories", None)      # These are what the agent is searching for, so if the user asks for an item it will use item name, if they ask for a category it will use category, etc.
 
-    # Build MongoDB query dynamically
-    query = {}
-
-    if item_name:
-        query["name"] = {"$regex": re.escape(item_name), "$options": "i"}   # This is the query that the agent will use to search for the item in the database the regex part makes it search for the exact name
-                                                                        # The $options: "i" makes it case insensitive
-    if category:
-        query["category"] = {"$regex": f"^{category}$", "$options": "i"}
-
     if max_calories is not None:
         try:
-            max_calories = int(max_calories)
-            query["calories"] = {"$lte": max_calories}  # This query lets the user ask for items with less than for example 400 calories
+            max_calories = int(max_calories) # This lets the user ask for items with less than for example 400 calories
         except ValueError:
             return "Invalid max_calories value. Please provide a number."
 
-    # Execute query and fetch results
-    items = list(menu_collection.find(query, {"_id": 0}))  # THis executes the query and fetches the results from the database
+    return {"item_name": item_name, "category": category, "max_calories": max_calories}
+
+def menu_query_key(args):
+    # Memo key for a get_menu_item input (see tool_memo.py), inputs that only differ in case, spacing or JSON layout
+    # share a key. Bad input gets None so it is never remembered
+    query = _parse_menu_query(args)
+    if isinstance(query, str):
+        return None
+    return ("menu", query["item_name"], query["category"], query["max_calories"])
+
+def get_menu_item(args) -> list:
+    query = _parse_menu_query(args)
+    if isinstance(query, str):
+        return query
+
+    # Searches the catalog instead of the database, names match case insensitive substrings and categories must match exactly.
+    # A name that is no substring of any item falls back to the typo tolerant match, see name_resolver.py
+    items = menu_catalog.find(**query)
 
     if not items:
         return "No matching items found." # If it cant find any items matching the query it will return this
 
-    return items   # Otherwise it returns the items it found
+    return items   # Otherwise it returns the items it found, see catalog.py for the match_confidence on typo tolerant matches
+
+async def aget_menu_item(args) -> list:
+    query = _parse_menu_query(args)
+    if isinstance(query, str):
+        return query
+
+    items = await menu_catalog.afind(**query)
+
+    if not items:
+        return "No matching items found."
+
+    return items
+
+def get_menu_items(names) -> dict:
+    # Looks up several item names at once, for combos and multi item orders. Returns {lowercase name: matching items},
+    # names with no match map to an empty list. Matching is the same as get_menu_item, typo tolerant matches included
+    return menu_catalog.find_names([name.strip().lower() for name in names])
+
+async def aget_menu_items(names) -> dict:
+    await menu_catalog.aensure_fresh()
+    return get_menu_items(names)
@@ -0,0 +1,57 @@
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage
+from langgraph.graph import MessagesState
+from prompts import message_text
+
+
+class ChatState(MessagesState):
+    summary: str # Rolling summary of the turns that were folded out of the message history
+
+
+SUMMARY_PROMPT = (
+    "You keep a short running summary of a conversation between a McDonald's customer and Ronald, the ordering assistant. "
+    "Update the summary with the new messages below. Keep what the customer asked for, preferences they mentioned, "
+    "questions still open and anything Ronald promised. Do not list the cart, it is tracked separately. "
+    "Reply with the updated summary only, in a few short sentences."
+)
+
+
+class HistoryPolicy:
+    """
+    Keeps the last keep_turns turns verbatim and folds older ones into a rolling summary. Folding waits until
+    fold_every extra turns have piled up, so the summarizer runs once every few turns instead of on every turn.
+    """
+
+    def __init__(self, summarizer, keep_turns=6, fold_every=4):
+        self.summarizer = summarizer # Any chat model, it is only called when turns are folded
+        self.keep_turns = keep_turns
+        self.fold_every = fold_every
+
+    def fold_point(self, messages):
+        # Index of the first message to keep, or None if there is nothing to fold yet. A turn starts at a human message
+        turn_starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        if len(turn_starts) <= self.keep_turns + self.fold_every:
+            return None
+        return turn_starts[-self.keep_turns]
+
+    async def summarize(self, summary, messages):
+        transcript = "\n".join(f"{message.type}: {message_text(message)}" for message in messages)
+        prompt = [
+            SystemMessage(SUMMARY_PROMPT),
+            HumanMessage(f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"),
+        ]
+        result = await self.summarizer.ainvoke(prompt)
+        return message_text(result).strip()
+
+    async def apply(self, state):
+        # Returns the state update that folds old turns, or an empty update when the history is still short enough
+        messages = state["messages"]
+        cut = self.fold_point(messages)
+        if cut is None:
+            return {}
+
+        folded = messages[:cut]
+        summary = await self.summarize(state.get("summary", ""), folded)
+        return {
+            "summary": summary,
+            "messages": [RemoveMessage(id=message.id) for message in folded], # Deletes them from the checkpoint too
+        }
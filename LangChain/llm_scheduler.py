@@ -0,0 +1,357 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from sessions import current_session
+from telemetry import llm_queue_seconds, llm_rejected_total, llm_retries_total
+
+
+# Every async LLM call goes through one scheduler (see ScheduledChatModel below). At most LLM_MAX_CONCURRENCY calls
+# run at once and the rest wait in a queue that takes turns between sessions, so one busy conversation cant starve
+# the others. When the queue is full, the turn has run out of time or Gemini keeps failing, the call fails at once
+# with LLMUnavailable and /chat tells the customer to try again instead of hanging
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))              # calls waiting for a slot before new ones are shed
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))       # seconds for one attempt
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "60")) # all the LLM calls of one chat message
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))     # failed calls in a row that open the breaker
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))   # seconds before one trial call is let through
+
+BUSY_MESSAGE = "We're a little busy right now, please try again in a few seconds." # What the customer sees when a call is refused
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504} # Rate limits and server side trouble, anything else is our own fault
+
+
+class LLMUnavailable(Exception):
+    reason = "unavailable"
+
+class Overloaded(LLMUnavailable):
+    reason = "overloaded"
+
+class CircuitOpen(LLMUnavailable):
+    reason = "circuit_open"
+
+class DeadlineExceeded(LLMUnavailable):
+    reason = "deadline"
+
+
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def turn_deadline(seconds=TURN_DEADLINE_SECONDS):
+    # Every LLM call made inside has to finish by the deadline, waiting for a slot and retries included
+    token = current_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def _remaining():
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None) # google.api_core errors carry the HTTP status as code
+    return status in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial_at = None # A half open breaker lets one trial call through, its outcome decides whether to close again
+        self.opened = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and (self.trial_at is None or time.monotonic() - self.trial_at >= self.cooldown):
+            self.trial_at = time.monotonic() # A trial that never reports back is replaced after another cooldown
+            return True
+        return False
+
+    def succeeded(self):
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial_at = None
+
+    def failed(self):
+        self.consecutive += 1
+        if self.trial_at is not None or self.consecutive >= self.failures:
+            if self.opened_at is None or self.trial_at is not None:
+                self.opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_at = None
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE, call_timeout=LLM_CALL_TIMEOUT,
+                 max_attempts=LLM_MAX_ATTEMPTS, breaker=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.call_timeout = call_timeout
+        self.max_attempts = max_attempts
+        self.breaker = breaker or CircuitBreaker()
+        self.running = 0
+        self._waiting = OrderedDict() # session id -> deque of futures, sessions take turns in this order
+        self.queued = 0
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "shed": 0, "deadline_exceeded": 0, "circuit_rejected": 0}
+
+    def _reject(self, error):
+        with self._lock:
+            key = {"overloaded": "shed", "deadline": "deadline_exceeded", "circuit_open": "circuit_rejected"}[error.reason]
+            self.stats[key] += 1
+        llm_rejected_total.inc(error.reason)
+        raise error
+
+    async def _acquire(self):
+        # Takes a slot, waiting in the session's queue if they are all busy. Raises Overloaded if the queue is full
+        remaining = _remaining()
+        if remaining is not None and remaining <= 0:
+            self._reject(DeadlineExceeded("The turn ran out of time before the model could answer"))
+        with self._lock:
+            if self.running < self.max_concurrency and not self.queued:
+                self.running += 1
+                return
+            if self.queued >= self.max_queue:
+                full = True
+            else:
+                full = False
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiting.setdefault(current_session.get(), deque()).append(waiter)
+                self.queued += 1
+        if full:
+            self._reject(Overloaded("Too many requests are waiting for the model"))
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), remaining)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    self._release_locked() # The slot was handed over just as we gave up, pass it on
+                else:
+                    waiter.cancel()
+                    self._forget(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(DeadlineExceeded("The turn ran out of time waiting for the model"))
+        finally:
+            llm_queue_seconds.observe(time.perf_counter() - started)
+
+    def _forget(self, waiter):
+        for session_id, waiters in list(self._waiting.items()):
+            if waiter in waiters:
+                waiters.remove(waiter)
+                self.queued -= 1
+                if not waiters:
+                    del self._waiting[session_id]
+                return
+
+    def _release(self):
+        with self._lock:
+            self._release_locked()
+
+    def _release_locked(self):
+        # Hands the slot to the first waiter of the next session in turn, that session then goes to the back
+        while self._waiting:
+            session_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            if not waiter.done():
+                waiter.set_result(None) # The slot passes straight to the waiter, running stays the same
+                return
+        self.running -= 1
+
+    def _check_breaker(self, take_trial):
+        # Checked once before queueing, so calls are shed at once while the breaker is open, and again with the slot
+        # in hand, where a half open breaker hands out its one trial call
+        with self._lock:
+            allowed = self.breaker.allow() if take_trial else self.breaker.state != "open"
+        if not allowed:
+            self._reject(CircuitOpen("The model is failing, calls are paused for a moment"))
+
+    def _attempt_timeout(self):
+        # Seconds the next attempt gets, and whether the turn's deadline set that rather than the call timeout
+        remaining = _remaining()
+        if remaining is None:
+            return self.call_timeout, False
+        if remaining <= 0:
+            self._reject(DeadlineExceeded("The turn ran out of time before the model could answer"))
+        return min(self.call_timeout, remaining), remaining < self.call_timeout
+
+    def _check_deadline(self, error, deadline_bound):
+        # A timeout the turn's own deadline cut short says nothing about the model, so it never reaches the breaker
+        # and the caller gets DeadlineExceeded like any other turn that ran out of time
+        if deadline_bound and isinstance(error, asyncio.TimeoutError):
+            self._reject(DeadlineExceeded("The turn ran out of time waiting for the model to answer"))
+
+    def _backoff(self, attempt):
+        # Full jitter, so calls that failed together dont all come back at the same moment
+        delay = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+        remaining = _remaining()
+        return delay if remaining is None else min(delay, max(0.0, remaining))
+
+    def _outcome(self, error=None):
+        # Only rate limits, server errors and timeouts count against the breaker. A bad request means Gemini answered,
+        # so a burst of them must not shut the model off for everyone
+        with self._lock:
+            if error is not None:
+                self.stats["failures"] += 1
+            if error is not None and is_retryable(error):
+                self.breaker.failed()
+            else:
+                self.breaker.succeeded()
+
+    async def _retry_after(self, attempt):
+        self._count_retry()
+        await asyncio.sleep(self._backoff(attempt))
+
+    async def run(self, call):
+        # call() returns a fresh awaitable for each attempt. Retries transient errors with jittered backoff, giving
+        # the slot back while it sleeps
+        for attempt in range(self.max_attempts):
+            self._check_breaker(take_trial=False)
+            await self._acquire()
+            deadline_bound = False
+            try:
+                timeout, deadline_bound = self._attempt_timeout()
+                self._check_breaker(take_trial=True)
+                with self._lock:
+                    self.stats["calls"] += 1
+                result = await asyncio.wait_for(call(), timeout)
+            except LLMUnavailable:
+                raise # Our own limits, not the model failing
+            except Exception as e:
+                self._check_deadline(e, deadline_bound)
+                self._outcome(e)
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    raise
+            else:
+                self._outcome()
+                return result
+            finally:
+                self._release()
+            await self._retry_after(attempt)
+
+    async def stream(self, chunks):
+        # chunks() returns a fresh async iterator for each attempt. Only retried until the first chunk is out, after
+        # that the caller has text it cant take back. Each chunk has to arrive within the attempt timeout
+        for attempt in range(self.max_attempts):
+            self._check_breaker(take_trial=False)
+            await self._acquire()
+            sent = False
+            deadline_bound = False
+            try:
+                self._attempt_timeout()
+                self._check_breaker(take_trial=True)
+                with self._lock:
+                    self.stats["calls"] += 1
+                iterator = chunks().__aiter__()
+                while True:
+                    timeout, deadline_bound = self._attempt_timeout()
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    sent = True
+                    yield chunk
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                self._check_deadline(e, deadline_bound)
+                self._outcome(e)
+                if sent or not is_retryable(e) or attempt == self.max_attempts - 1:
+                    raise
+            else:
+                self._outcome()
+                return
+            finally:
+                self._release()
+            await self._retry_after(attempt)
+
+    def _count_retry(self):
+        with self._lock:
+            self.stats["retries"] += 1
+        llm_retries_total.inc()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "queued": self.queued,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "circuit": self.breaker.state,
+                "circuit_opened": self.breaker.opened,
+                **self.stats,
+            }
+
+
+llm_scheduler = LLMScheduler()
+
+
+class ScheduledChatModel:
+    """
+    Mixin for a LangChain chat model that sends its async calls through llm_scheduler. Put it first in the bases,
+    e.g. class ScheduledGemini(ScheduledChatModel, ChatGoogleGenerativeAI). bind_tools keeps the same model, so
+    tool calling models are scheduled too. Sync calls are left alone, only scripts make those.
+    """
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await llm_scheduler.run(lambda: super(ScheduledChatModel, self)._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not self._streams():
+            # The wrapped model cant stream, send the whole reply as one chunk so astream_events still works
+            result = await self._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            yield ChatGenerationChunk(message=_as_chunk(result.generations[0].message))
+            return
+        async for chunk in llm_scheduler.stream(lambda: super(ScheduledChatModel, self)._astream(messages, stop=stop, run_manager=run_manager, **kwargs)):
+            yield chunk
+
+    def _streams(self):
+        # True if a class after this mixin implements streaming, BaseChatModel's own versions only raise NotImplementedError
+        mro = type(self).__mro__
+        for klass in mro[mro.index(ScheduledChatModel) + 1:]:
+            if "_stream" in vars(klass) or "_astream" in vars(klass):
+                return klass is not BaseChatModel
+        return False
+
+
+def _as_chunk(message):
+    tool_call_chunks = [{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                        for index, call in enumerate(message.tool_calls)]
+    tool_call_chunks += [{"name": call["name"], "args": call["args"], "id": call["id"], "index": len(tool_call_chunks) + index}
+                         for index, call in enumerate(message.invalid_tool_calls)]
+    return AIMessageChunk(content=message.content, additional_kwargs=message.additional_kwargs, response_metadata=message.response_metadata,
+                          usage_metadata=message.usage_metadata, id=message.id, tool_call_chunks=tool_call_chunks)
@@ -1,11 +1,49 @@
+from startup import startup_report # First, so the report's clock covers the imports below
 from langchain_core.messages import HumanMessage
 from agent import app
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
+from sessions import bind_session, new_session_id
+from streaming import stream_chat
+from router import router_stats
+from response_cache import response_cache
+from tool_memo import tool_memo_stats, tool_turn
+from telemetry import agent_timer, render_metrics, trace_request, traces
+from prompts import prompt_stats
+from order_queue import order_writer
+from analytics import sales_rollups
+from model_tiers import tier_stats
+from llm_scheduler import BUSY_MESSAGE, LLMUnavailable, llm_scheduler, turn_deadline
+from database import menu_catalog
+from config import ADMIN_TOKEN, menu_collection, mongo, ping
+from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
+import secrets
 
-fastapi_app = FastAPI()
+startup_report.imports_done()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Nothing here waits on Mongo. The menu comes from the local snapshot if there is one and the live menu replaces
+    # it in the background, without a snapshot the first menu lookup waits for that load instead
+    with startup_report.phase("menu snapshot"):
+        menu_catalog.load_snapshot()
+    startup_report.background("menu refresh", menu_catalog.refresh)
+    startup_report.background("mongo ping", ping)
+    startup_report.background("rollup indexes", sales_rollups.ensure_indexes)
+    menu_catalog.watch(menu_collection) # Keeps the catalog in sync with the menu collection
+    with startup_report.phase("order writer"):
+        order_writer.start() # Writes queued orders to Mongo in the background, including any left over from the last run
+    startup_report.ready()
+    yield
+    order_writer.stop()
+    mongo.close()
+
+fastapi_app = FastAPI(lifespan=lifespan)
 
 # Allows for Javascript code with a different origin to communicate with server
 fastapi_app.add_middleware(
@@ -18,20 +56,99 @@ fastapi_app.add_middleware(
 
 class UserRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None # The browser sends back the id we gave it, a request without one starts a new session
 
 @fastapi_app.post("/chat")
-def chat(request: UserRequest):
+async def chat(request: UserRequest):
     try:
         user_input = request.message
         if not user_input:
             raise HTTPException(status_code=400, detail="No message provided")
     
+        session_id = request.session_id or new_session_id()
         input_messages = [HumanMessage(user_input)]
-        output = app.invoke({"messages": input_messages}, {"configurable": {"thread_id": "abc345"},"response_format": "json"},)
-        return {"content": output["messages"][-1].content}
+        # Binds the cart tools to this customer's cart for the whole agent run, times every step of it, and answers
+        # repeated lookups within the turn from the turn's memo
+        with trace_request("/chat", session_id), bind_session(session_id), tool_turn(), turn_deadline():
+            output = await app.ainvoke({"messages": input_messages}, {"configurable": {"thread_id": session_id},"response_format": "json", "callbacks": [agent_timer]},)
+        return {"content": output["messages"][-1].content, "session_id": session_id}
+    except LLMUnavailable as e:
+        # The model is saturated, failing or too slow for this turn. Answer right away so the client can back off
+        return JSONResponse(status_code=503, headers={"Retry-After": "5"},
+                            content={"error": BUSY_MESSAGE, "reason": e.reason, "session_id": session_id})
     except Exception as e:
         return {"error": "Something went wrong while processing your message. Please try again later."}
 
+@fastapi_app.post("/chat/stream")
+async def chat_stream(request: UserRequest):
+    # Same as /chat, but the reply is sent as Server-Sent Events while the agent is still working
+    if not request.message:
+        raise HTTPException(status_code=400, detail="No message provided")
+
+    session_id = request.session_id or new_session_id()
+    return StreamingResponse(
+        stream_chat(app, request.message, session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # Stops proxies from holding the stream back
+    )
+
+@fastapi_app.get("/health")
+async def health():
+    # Liveness plus a fresh Mongo probe. The server keeps answering when Mongo is down, so this only reports it
+    try:
+        await asyncio.to_thread(mongo.ping)
+    except Exception:
+        pass # Recorded in the health snapshot
+    return {"status": "ok", "mongo": mongo.health()}
+
+@fastapi_app.get("/ready")
+async def ready():
+    # Ready once there is a menu to serve, orders are spooled locally so they dont need Mongo to be up
+    if not menu_catalog.loaded:
+        return JSONResponse({"ready": False, "mongo": mongo.health()}, status_code=503)
+    return {"ready": True, "menu_generation": menu_catalog.generation, "mongo": mongo.health()}
+
+@fastapi_app.get("/metrics")
+async def metrics():
+    # Prometheus text format, latency histograms and error counters for chat requests, LLM calls, tools and Mongo
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found") # Turned off, same answer as a route that does not exist
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@fastapi_app.get("/traces", dependencies=[Depends(require_admin)])
+async def recent_traces(session_id: Optional[str] = None):
+    # The timing spans of the last few hundred requests, newest last. Sessions show as hashes, pass session_id to filter on one
+    return traces(session_id)
+
+@fastapi_app.get("/analytics/sales", dependencies=[Depends(require_admin)])
+async def sales(period: str = "hour", since: Optional[str] = None, limit: int = 48):
+    # Sales per hour or per day from the rollups the order writer keeps, never a scan of the orders. since is an ISO
+    # date or timestamp, without it the newest limit buckets are returned
+    try:
+        return await sales_rollups.sales(period, since, max(1, min(limit, 1000)))
+    except ValueError as e: # Unknown period or a since that is not ISO
+        raise HTTPException(status_code=400, detail=str(e))
+
+@fastapi_app.get("/stats")
+async def stats():
+    # How often the fast path and the response cache answered without the model, how many tool lookups the turn memo saved, what the prompt costs in tokens per turn, how the order queue is doing
+    # and how long the last cold start took
+    return {
+        "router": router_stats.snapshot(),
+        "cache": response_cache.snapshot(),
+        "tools": tool_memo_stats.snapshot(),
+        "prompt": prompt_stats.snapshot(),
+        "llm": llm_scheduler.snapshot(),
+        "tiers": tier_stats.snapshot(),
+        "orders": order_writer.snapshot(),
+        "rollups": sales_rollups.snapshot(),
+        "startup": startup_report.snapshot(),
+    }
+
 if __name__ == "__main__":
 
     uvicorn.run(fastapi_app, host="0.0.0.0", port=8000)
\ No newline at end of file
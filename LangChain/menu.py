@@ -1,24 +1,10 @@
-import os
-from dotenv import load_dotenv
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
-
-load_dotenv("API.env")
-uri = os.getenv("MONGODB_URI")
-print(uri)
-client = MongoClient(uri, server_api=ServerApi('1'))
-try:
-    client.admin.command('ping')
-    print("Pinged your deployment. You successfully connected to MongoDB!")
-except Exception as e:
-    print("Connection Error:",e)
-
-db = client["Menu_DB"]  # Database name
-menu_collection = db["menu"]  # Collection name
+# Run menu_sync.py (or this file) to load the menu into Mongo. Importing it only gives you menu_data, the benchmark
+# seeds its in-process database from it. "aliases" are other names customers use for an item, see name_resolver.py
 
 menu_data = [
     {
         "name": "Big Mac",
+        "aliases": ["bigmac"],
         "category": "Burgers",
         "price": 5.29,
         "ingredients": [
@@ -36,6 +22,7 @@ menu_data = [
     },
     {
         "name": "Quarter Pounder with Cheese",
+        "aliases": ["quarter pounder", "qpc"],
         "category": "Burgers",
         "price": 6.39,
         "ingredients": [
@@ -53,6 +40,7 @@ menu_data = [
     },
     {
         "name": "Double Quarter Pounder with Cheese",
+        "aliases": ["double quarter pounder"],
         "category": "Burgers",
         "price": 7.49,
         "ingredients": [
@@ -115,6 +103,7 @@ menu_data = [
     },
     {
         "name": "Filet-O-Fish",
+        "aliases": ["fish sandwich", "fish burger"],
         "category": "Chicken & Fish Sandwiches",
         "price": 4.99,
         "ingredients": [
@@ -129,6 +118,7 @@ menu_data = [
     },
     {
         "name": "10 piece Chicken McNuggets",
+        "aliases": ["nuggets", "chicken nuggets", "mcnuggets"],
         "category": "McNuggets & Meals",
         "price": 5.49,
         "ingredients": [
@@ -143,6 +133,7 @@ menu_data = [
     },
     {
         "name": "French Fries (Small)",
+        "aliases": ["small fries"],
         "category": "Sides",
         "price": 1.91,
         "ingredients": [
@@ -157,6 +148,7 @@ menu_data = [
     },
     {
         "name": "French Fries (Medium)",
+        "aliases": ["fries", "medium fries"],
         "category": "Sides",
         "price": 2.99,
         "ingredients": [
@@ -171,6 +163,7 @@ menu_data = [
     },
     {
         "name": "French Fries (Large)",
+        "aliases": ["large fries"],
         "category": "Sides",
         "price": 3.59,
         "ingredients": [
@@ -194,6 +187,7 @@ menu_data = [
     },
     {
         "name": "Coca-Cola (Medium)",
+        "aliases": ["coke", "cola", "coca cola"],
         "category": "Beverages",
         "price": 1.99,
         "ingredients": [
@@ -210,6 +204,7 @@ menu_data = [
     },
     {
         "name": "Sprite (Medium)",
+        "aliases": ["sprite"],
         "category": "Beverages",
         "price": 1.99,
         "ingredients": [
@@ -225,6 +220,7 @@ menu_data = [
     },
     {
         "name": "Iced Coffee",
+        "aliases": ["coffee"],
         "category": "Beverages",
         "price": 2.49,
         "ingredients": [
@@ -239,6 +235,8 @@ menu_data = [
     }
 ]
 
-# Insert data into MongoDB
-menu_collection.insert_many(menu_data)
-print("Menu inserted successfully!")
+if __name__ == "__main__":
+    # Kept for muscle memory, loading the menu is menu_sync.py's job now. It only writes what changed, so running it
+    # again does not duplicate the menu
+    import menu_sync
+    menu_sync.main()
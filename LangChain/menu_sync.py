@@ -0,0 +1,151 @@
+"""
+Brings the menu collection in line with menu_data from menu.py. Safe to run any number of times, it only writes the
+items that were added, changed or removed, and drops duplicates left behind by older loads.
+
+    python menu_sync.py            apply the changes
+    python menu_sync.py --dry-run  only print what would change
+
+Also creates the indexes the menu queries rely on, and bumps the menu version in the meta collection whenever the
+menu changed, so the catalog and the response cache pick the change up.
+"""
+import argparse
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DeleteOne, ReplaceOne
+from pymongo.errors import OperationFailure
+
+
+# name -> (keys, options). Names are unique, categories and calories are what get_menu_item filters on
+MENU_INDEXES = {
+    "name_unique": ([("name", ASCENDING)], {"unique": True}),
+    "category": ([("category", ASCENDING)], {}),
+    "calories": ([("calories", ASCENDING)], {}),
+}
+
+
+class MenuDiff:
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.duplicates = 0
+        self.unchanged = 0
+        self.operations = []
+
+    def __bool__(self):
+        return bool(self.operations)
+
+    def summary(self):
+        return {
+            "added": self.added,
+            "changed": self.changed,
+            "removed": self.removed,
+            "duplicates_removed": self.duplicates,
+            "unchanged": self.unchanged,
+        }
+
+
+def diff_menu(menu_items, existing_docs):
+    # Works out the writes that turn existing_docs into menu_items. Items are matched on their name ignoring case, the
+    # same way the catalog looks them up, and the first copy of a duplicated item is the one that is kept
+    desired = {}
+    for item in menu_items:
+        desired[item["name"].lower()] = item
+
+    diff = MenuDiff()
+    kept = {}
+    for doc in existing_docs:
+        key = doc.get("name", "").lower()
+        if key in kept:
+            diff.duplicates += 1
+            diff.operations.append(DeleteOne({"_id": doc["_id"]}))
+        elif key not in desired:
+            diff.removed.append(doc.get("name"))
+            diff.operations.append(DeleteOne({"_id": doc["_id"]}))
+        else:
+            kept[key] = doc
+
+    for key, item in desired.items():
+        doc = kept.get(key)
+        if doc is None:
+            diff.added.append(item["name"])
+            diff.operations.append(ReplaceOne({"name": item["name"]}, dict(item), upsert=True))
+        elif {field: value for field, value in doc.items() if field != "_id"} != item:
+            diff.changed.append(item["name"])
+            diff.operations.append(ReplaceOne({"_id": doc["_id"]}, dict(item)))
+        else:
+            diff.unchanged += 1
+    return diff
+
+
+def ensure_indexes(collection):
+    # Creates any missing index and checks the existing ones match, returns a list of problems (empty when all is well)
+    problems = []
+    for name, (keys, options) in MENU_INDEXES.items():
+        try:
+            collection.create_index(keys, name=name, **options)
+        except OperationFailure as e: # An index with the same keys but other options, or the same name but other keys
+            problems.append(f"{name}: {e}")
+
+    existing = collection.index_information()
+    for name, (keys, options) in MENU_INDEXES.items():
+        index = existing.get(name)
+        if index is None:
+            problems.append(f"{name}: missing")
+        elif [tuple(key) for key in index["key"]] != keys:
+            problems.append(f"{name}: has keys {index['key']}, expected {keys}")
+        elif bool(index.get("unique")) != options.get("unique", False):
+            problems.append(f"{name}: unique is {bool(index.get('unique'))}, expected {options.get('unique', False)}")
+    return problems
+
+
+def bump_menu_version(meta_collection):
+    doc = meta_collection.find_one_and_update(
+        {"_id": "menu"},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True,
+        return_document=True,
+    )
+    return doc["version"]
+
+
+def sync_menu(menu_collection, meta_collection, menu_items, dry_run=False):
+    # Duplicates are removed before the unique index on name is built, otherwise building it would fail
+    diff = diff_menu(menu_items, menu_collection.find({}))
+    result = diff.summary()
+    if dry_run:
+        return result
+
+    if diff:
+        menu_collection.bulk_write(diff.operations, ordered=True) # Ordered, so the duplicate deletes land before the upserts
+        result["version"] = bump_menu_version(meta_collection)
+    result["index_problems"] = ensure_indexes(menu_collection)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="print the changes without writing them")
+    args = parser.parse_args()
+
+    from config import mongo
+    from menu import menu_data
+
+    # Same pool settings as the server, with no read preference so the diff reads from the primary it writes to
+    result = sync_menu(mongo.collection("menu"), mongo.collection("meta"), menu_data, dry_run=args.dry_run)
+
+    for change in ("added", "changed", "removed"):
+        for name in result[change]:
+            print(f"{change}: {name}")
+    print(f"{result['duplicates_removed']} duplicates removed, {result['unchanged']} unchanged")
+    if args.dry_run:
+        return
+    if "version" in result:
+        print("Menu version is now", result["version"])
+    else:
+        print("Menu already up to date")
+    for problem in result["index_problems"]:
+        print("Index problem:", problem)
+
+
+if __name__ == "__main__":
+    main()
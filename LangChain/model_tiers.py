@@ -0,0 +1,116 @@
+import contextvars
+import os
+import re
+import threading
+from collections import deque
+from langchain_core.messages import AIMessage, ToolMessage
+
+
+# Most turns are simple, "thanks", "what's in a McChicken?", "add a coke", and a small fast model answers them as
+# well as a big one. Turns with combos, modifications, several items or a lot of text go to the stronger model, and a
+# turn on the fast model moves to the strong one as soon as the fast model sends a tool call we cant parse or a tool
+# fails. Set FAST_MODEL and STRONG_MODEL to the same model to turn routing off
+
+FAST_MODEL = os.getenv("FAST_MODEL", "gemini-2.0-flash-lite")
+STRONG_MODEL = os.getenv("STRONG_MODEL", "gemini-2.0-flash")
+TIERS = ("fast", "strong")
+
+LONG_TURN_WORDS = 25
+COMBO_PATTERN = re.compile(r"\b(combo|combos|meal|meals)\b")
+MODIFICATION_PATTERN = re.compile(r"\b(without|extra|light|hold the|instead|swap|replace|no (?!thanks?\b|thank you\b|problem\b)\w+)")
+ITEM_SEPARATOR = re.compile(r",|\b(and|plus|also|with)\b")
+
+
+def classify_turn(text):
+    # Returns (tier, reason) for the customer's message
+    text = text.strip().lower()
+    if len(text.split()) > LONG_TURN_WORDS:
+        return "strong", "long"
+    if COMBO_PATTERN.search(text):
+        return "strong", "combo"
+    if MODIFICATION_PATTERN.search(text):
+        return "strong", "modifications"
+    if len(ITEM_SEPARATOR.findall(text)) >= 2:
+        return "strong", "multi_item"
+    return "fast", "simple"
+
+
+def tier_of(message):
+    return message.response_metadata.get("tier") if isinstance(message, AIMessage) else None
+
+
+def turn_failure(turn):
+    # Why the fast model should hand the rest of the turn over, or None. turn is the customer's message and everything after it
+    for message in turn:
+        if isinstance(message, ToolMessage) and message.status == "error":
+            return "tool_error"
+        if isinstance(message, AIMessage) and message.invalid_tool_calls:
+            return "parse_error"
+    return None
+
+
+def tier_for_step(turn):
+    # (tier, escalation reason) for the next model step of a turn. Once a turn has used the strong model it stays there
+    if any(tier_of(message) == "strong" for message in turn):
+        return "strong", None
+    tier, _ = classify_turn(turn[0].content)
+    if tier == "strong":
+        return "strong", None
+    failure = turn_failure(turn)
+    return ("strong", failure) if failure else ("fast", None)
+
+
+class EscalateTurn(Exception):
+    # Raised out of the fast ReAct agent on a reply it cant parse, call_model then runs the turn on the strong agent
+    reason = "parse_error"
+
+
+react_turn_cart = contextvars.ContextVar("react_turn_cart", default=None)
+
+
+class TierStats:
+    def __init__(self, size=500):
+        self._lock = threading.Lock()
+        self.turns = {tier: 0 for tier in TIERS}
+        self.calls = {tier: 0 for tier in TIERS}
+        self.reasons = {}      # classification reason -> turns
+        self.escalations = {}  # escalation reason -> turns
+        self._latency = {tier: deque(maxlen=size) for tier in TIERS} # seconds per model call, the latest size of them
+
+    def turn(self, tier, reason):
+        with self._lock:
+            self.turns[tier] += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def escalated(self, reason):
+        with self._lock:
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+
+    def call(self, tier, seconds):
+        with self._lock:
+            self.calls[tier] += 1
+            self._latency[tier].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            tiers = {}
+            for tier in TIERS:
+                samples = sorted(self._latency[tier])
+                tiers[tier] = {
+                    "model": FAST_MODEL if tier == "fast" else STRONG_MODEL,
+                    "turns": self.turns[tier],
+                    "calls": self.calls[tier],
+                    "mean_ms": round(sum(samples) / len(samples) * 1000, 1) if samples else None,
+                    "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000, 1) if samples else None,
+                }
+            escalated = sum(self.escalations.values())
+            return {
+                "tiers": tiers,
+                "turns_by_reason": dict(self.reasons),
+                "escalations": escalated,
+                "escalations_by_reason": dict(self.escalations),
+                "escalation_rate": escalated / self.turns["fast"] if self.turns["fast"] else 0.0,
+            }
+
+
+tier_stats = TierStats()
@@ -0,0 +1,129 @@
+import re
+
+
+# Maps what the customer (or the agent) calls an item to the menu item they mean, "bigmac", "Big Mac burger" and
+# "big mca" all resolve to Big Mac. Every name and alias is indexed by its character trigrams when the menu loads, a
+# lookup scores the aliases that share trigrams with the query and checks the best ones with edit distance
+
+MATCH_THRESHOLD = 0.72  # lowest score that counts as a match
+TIE_MARGIN = 0.02       # matches this close to the best one are returned too, the caller picks between them
+CANDIDATES = 25         # aliases with the most trigrams in common that get the slower edit distance check
+CONFIDENT_MATCH = 0.85  # below this a match is only a guess, the cart asks the customer before acting on it
+FILLER_WORDS = {"a", "an", "the", "some", "please", "burger", "sandwich", "order", "of", "mcdonalds"}
+SIZES = ("small", "medium", "large")
+# Words that change which item is meant. A query with one the alias does not have is a different item, "diet coke" is not a Coke
+QUALIFIER_WORDS = {"small", "medium", "large", "extra", "diet", "zero", "light", "decaf", "double", "triple", "single",
+                   "mini", "kids", "junior", "jr", "spicy", "grilled", "crispy", "vanilla", "chocolate", "strawberry"}
+NUMBER_WORDS = {"one", "two", "three", "four", "five", "six", "eight", "ten", "twelve", "twenty", "forty"}
+QUALIFIER_PENALTY = 0.25  # taken off per qualifier or number in the query that the alias does not have
+
+
+def normalize(text):
+    # Lowercase words with punctuation dropped, "Filet-O-Fish" -> "filet o fish"
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def compact(text):
+    return text.replace(" ", "")
+
+
+def trigrams(text):
+    padded = f"  {compact(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    # Levenshtein distance where swapping two neighbouring letters counts as one edit, "mca" is one typo away from "mac"
+    before, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        before, previous = previous, current
+    return previous[-1]
+
+
+def is_qualifier(word):
+    return word.isdigit() or word in NUMBER_WORDS or word in QUALIFIER_WORDS
+
+
+def aliases_for(item):
+    # The item's name, its "aliases" field, and the obvious variants people type. "French Fries (Large)" also answers
+    # to "french fries" and "large french fries"
+    name = normalize(item.get("name", ""))
+    aliases = {name} | {normalize(alias) for alias in item.get("aliases", [])}
+    match = re.match(r"^(.*?)\s*\((.*)\)$", item.get("name", ""))
+    if match:
+        base, detail = normalize(match.group(1)), normalize(match.group(2))
+        aliases.add(f"{detail} {base}")
+        if detail not in SIZES or detail == "medium": # A bare "fries" means the medium, not whichever size comes first
+            aliases.add(base)
+    return {alias for alias in aliases if alias}
+
+
+class NameResolver:
+    def __init__(self, items):
+        self.aliases = []  # (alias, compact alias, trigrams, item position)
+        self.exact = {}    # compact alias -> (item position, alias)
+        self.by_trigram = {}  # trigram -> indexes into self.aliases
+        self.item_words = {}  # item position -> every word of its aliases, "10 nuggets" is fine for the 10 piece
+        for position, item in enumerate(items):
+            for alias in sorted(aliases_for(item)):
+                self.item_words.setdefault(position, set()).update(alias.split())
+                key = compact(alias)
+                if key in self.exact:
+                    continue # Two items claim the same alias, the first one keeps it
+                self.exact[key] = (position, alias)
+                grams = trigrams(alias)
+                for gram in grams:
+                    self.by_trigram.setdefault(gram, []).append(len(self.aliases))
+                self.aliases.append((alias, key, grams, position))
+
+    def resolve(self, query, limit=3):
+        # Best matches for the query as (score, position, alias), best first and one per item. Scores run from 0 to 1
+        words = [word for word in normalize(query).split() if word not in FILLER_WORDS]
+        text = " ".join(words)
+        key = compact(text)
+        if not key:
+            return []
+        if key in self.exact: # Spacing and punctuation dont matter, "bigmac" is "Big Mac"
+            position, alias = self.exact[key]
+            return [(1.0, position, alias)]
+
+        grams = trigrams(text)
+        shared = {}
+        for gram in grams:
+            for alias_index in self.by_trigram.get(gram, ()):
+                shared[alias_index] = shared.get(alias_index, 0) + 1
+
+        best = {}  # position -> (score, alias)
+        for alias_index, count in sorted(shared.items(), key=lambda entry: -entry[1])[:CANDIDATES]:
+            alias, alias_key, alias_grams, position = self.aliases[alias_index]
+            dice = 2 * count / (len(grams) + len(alias_grams))
+            if dice < 0.3:
+                continue
+            similarity = 1 - edit_distance(key, alias_key) / max(len(key), len(alias_key))
+            score = 0.4 * dice + 0.6 * similarity # Trigrams are thrown off by one typo more than edit distance is
+            alias_words = set(alias.split())
+            if alias_words <= set(words): # The alias plus extra words, "big mac meal" still means a Big Mac
+                score = max(score, 0.8 + 0.15 * len(alias_key) / len(key))
+            score -= QUALIFIER_PENALTY * sum(1 for word in words if word not in self.item_words[position] and is_qualifier(word))
+            if score > 0 and score > best.get(position, (0.0, None))[0]:
+                best[position] = (round(score, 3), alias)
+
+        ranked = sorted(((score, position, alias) for position, (score, alias) in best.items()), key=lambda match: (-match[0], match[1]))
+        return ranked[:limit]
+
+    def matches(self, query):
+        # Positions of the items the query means, the best match plus any near tie, or [] if nothing scores high enough
+        return list(self.scored_matches(query))
+
+    def scored_matches(self, query):
+        # Same as matches, as {position: score} best first
+        ranked = self.resolve(query)
+        if not ranked or ranked[0][0] < MATCH_THRESHOLD:
+            return {}
+        return {position: score for score, position, _ in ranked if score >= ranked[0][0] - TIE_MARGIN}
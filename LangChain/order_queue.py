@@ -0,0 +1,232 @@
+import glob
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pymongo.errors import BulkWriteError
+from analytics import sales_rollups
+from config import orders_collection
+from telemetry import mongo_span
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Orders are acknowledged as soon as they are safely on local disk. A background writer moves them to Mongo in
+# batches, so Atlas latency is never part of the customer's wait and a Mongo hiccup only delays the write
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    # Holds an exclusive lock on path against other processes. Yields False instead of waiting if blocking is off and
+    # another process has it. The OS drops the lock when a process dies, so a crash never leaves it stuck
+    with open(path, "a+b") as handle:
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class OrderSpool:
+    """
+    Append-only file of orders waiting to be written. The writer claims the whole file by renaming it, new orders
+    go to a fresh file, and the claimed file is deleted once all its orders are in Mongo.
+    Every uvicorn worker shares the one spool. Appends and claims take a lock file, so no order is written into a file
+    another worker has just claimed, and only one worker's writer drains at a time (see draining).
+    """
+
+    def __init__(self, path="order_spool.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, _file_lock(f"{self.path}.lock"):
+            yield
+
+    def append(self, order_document):
+        order_document.setdefault("_id", uuid.uuid4().hex) # Used as the Mongo _id, so an order retried after a timeout is only stored once
+        line = json.dumps(order_document) + "\n"
+        with self._locked():
+            with open(self.path, "a", encoding="utf-8") as spool:
+                spool.write(line)
+                spool.flush()
+                os.fsync(spool.fileno()) # The order is only acknowledged once it would survive a crash
+        return order_document["_id"]
+
+    def draining(self):
+        # Yields True if this process may write the claimed files to Mongo. One writer at a time, otherwise two workers
+        # would send the same files and delete them under each other
+        return _file_lock(f"{self.path}.drain", blocking=False)
+
+    def claim(self):
+        # Returns the paths of every batch file waiting to be written, including ones left over from a crash
+        with self._locked():
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                os.replace(self.path, f"{self.path}.{time.time_ns()}.sending")
+        return sorted(glob.glob(f"{glob.escape(self.path)}.*.sending"))
+
+    def pending(self):
+        count = 0
+        for path in [self.path] + glob.glob(f"{glob.escape(self.path)}.*.sending"):
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as spool:
+                    count += sum(1 for line in spool if line.strip())
+        return count
+
+
+def read_orders(path):
+    orders = []
+    with open(path, encoding="utf-8") as spool:
+        for line in spool:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                orders.append(json.loads(line))
+            except json.JSONDecodeError:
+                print("Skipping damaged order line in", path) # Only possible for a line cut short by a crash, it was never acknowledged
+    return orders
+
+
+class OrderWriter:
+    def __init__(self, spool, collection, rollups=None, batch_size=500, flush_interval=0.5, max_backoff=60):
+        self.spool = spool
+        self.collection = collection
+        self.rollups = rollups # Sales rollups to add each stored batch to, see analytics.py
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval # Orders arriving within this window are written together
+        self.max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {"orders_written": 0, "batches": 0, "retries": 0, "last_error": None}
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        # Tries to write whatever is left before shutting down, anything that fails stays in the spool for next start
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff = 1
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.drain()
+                backoff = 1
+            except Exception as e:
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                    self.stats["last_error"] = str(e)
+                print("Order writer failed, retrying:", e)
+                if self._stopping.is_set():
+                    return
+                self._stopping.wait(backoff + random.uniform(0, backoff)) # Jitter so restarted workers dont retry in lockstep
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            if self._stopping.is_set():
+                return
+
+    def drain(self):
+        with self.spool.draining() as ours:
+            if not ours:
+                return # Another worker's writer is draining, it picks these orders up too
+            for path in self.spool.claim():
+                orders = read_orders(path)
+                for start in range(0, len(orders), self.batch_size):
+                    self._insert(orders[start:start + self.batch_size])
+                os.remove(path) # Only once every batch in the file is stored, a failure above leaves the file to be retried
+
+    def _insert(self, batch):
+        for order in batch:
+            order.setdefault("recorded", False) # Set once the order is counted and in the sales rollups, see _record
+        try:
+            with mongo_span("insert_orders"):
+                self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate _ids mean an earlier attempt stored the order, perhaps without hearing back, so it may never have
+            # been counted. Anything else is a real failure
+            write_errors = e.details.get("writeErrors", [])
+            failed = {error.get("index") for error in write_errors}
+            duplicates = [batch[error["index"]] for error in write_errors if error.get("code") == 11000]
+            self._record([order for i, order in enumerate(batch) if i not in failed] + self._unrecorded(duplicates))
+            if len(duplicates) < len(write_errors) or e.details.get("writeConcernErrors"):
+                raise
+        else:
+            self._record(batch)
+        with self._stats_lock:
+            self.stats["batches"] += 1
+
+    def _unrecorded(self, orders):
+        # The redelivered orders whose first insert went through but was never recorded
+        if not orders:
+            return []
+        with mongo_span("find_unrecorded_orders"):
+            waiting = {document["_id"] for document in self.collection.find({"_id": {"$in": [order["_id"] for order in orders]}, "recorded": False}, {"_id": 1})}
+        return [order for order in orders if order["_id"] in waiting]
+
+    def _record(self, orders):
+        # Counts stored orders and adds them to the rollups. The orders are marked first, so a redelivered order is never
+        # counted twice. A rollup failure is only reported, the orders are stored and analytics.py --rebuild puts the counts right
+        if not orders:
+            return
+        with mongo_span("mark_orders_recorded"):
+            self.collection.update_many({"_id": {"$in": [order["_id"] for order in orders]}}, {"$set": {"recorded": True}})
+        with self._stats_lock:
+            self.stats["orders_written"] += len(orders)
+        if self.rollups is None:
+            return
+        try:
+            self.rollups.record(orders)
+        except Exception as e:
+            print("Sales rollup failed:", e)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["pending"] = self.spool.pending()
+        return stats
+
+
+order_spool = OrderSpool()
+order_writer = OrderWriter(order_spool, orders_collection, sales_rollups)
+
+
+def submit_order(order_document):
+    order_id = order_spool.append(order_document)
+    order_writer.notify()
+    return order_id
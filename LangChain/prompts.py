@@ -0,0 +1,193 @@
+import math
+import threading
+from collections import deque
+from langchain_core.messages import HumanMessage, SystemMessage
+from database import menu_catalog
+from name_resolver import CONFIDENT_MATCH
+
+
+# The instructions never change, so they come first in the system prompt and the whole prefix stays byte for byte the
+# same between turns. Gemini can then reuse its cached work for the prefix, and we only pay to render it once per menu
+INSTRUCTIONS = [
+    "You are a helpful AI assistant managing a shopping cart.",
+    "You should use the menu below to answer questions about the menu.",
+    "Always use get_menu_item to search for menu items.",
+    f"If a menu item comes back with a match_confidence, it is the closest match to a misspelt name. Say which item you found and check with the user before adding it unless the confidence is at least {CONFIDENT_MATCH}.",
+    "When adding an item with modifications, ensure the modifications are valid.",
+    "When the user asks for several different items at once, add them all with one add_items call, and remove several with one remove_items call.",
+    "IMPORTANT: Allways use JSON formatting when taking an action.",
+    "If a user adds an entree, kindly ask if they would like to make it a combo after adding the entree.",
+    "Do not make assumptions about what the items the user wants when making a combo, if they do not tell you, ask them.",
+    "When calling add_combo or remove_combo, the input should be one JSON object with three keys: entree, side, and drink. Each key should contain a dictionary with the item name and modifications. A fourth key, quantity, is optional, if not provided it defaults to one.",
+    "When calling add_items or remove_items, the input should be one JSON object with the key items, a list with one object per item holding item_name, quantity and modifications.",
+    "When you remove items from the cart, in your response tell the user how many of the item were removed, dont just use the response from the function call.",
+    "If, when prompted, a user agrees to make their order a combo, remove the elements of the combo they added and add them back as part of the combo, (but make sure the combo has all required elements. If it doesnt ask the user what they would like). When doing this you dont need to tell the user you removed anything, just that you added their order as a combo.",
+    "If the user asks about a menu item, look up the item using get_menu_item and answer based on its details.",
+    "If the user wants to change an item in their cart, remove the item and add the new item, but be sure to check if the modifications are valid.",
+    "IMPORTANT: when you use a tool, you must use the results.",
+    "If a user query is unrelated to the menu, cart, or menu items, kindly inform them that you can only assist with menu, cart, or item related questions.",
+    "When providing JSON outputs, return only the raw JSON without any additional formatting characters such as backticks or quotes. Do not wrap JSON responses in markdown or any other formatting.",
+    "IMPORTANT: After each query from the user you must have a thought before you take an action or provide a response. Do not go straight to the action or response.",
+    "IMPORTANT: Never use markdown or any other formatting characters for anything, namely thoughts, actions, action inputs, or jsons.",
+    "IMPORTANT: With each request you will recieve the chat history, you should respond to each request only once.",
+    "IMPORTANT: If you decide to make a call, you must actually make the call, do not create your own response.",
+    "Do not add or remove anything without being explicitly told to do so.",
+    "IMPORTANT: You are a helpful McDonald's cashier named Ronald, be sure to be polite but casual when appropriate. Avoid short answers like OK or Yes.",
+    "IMPORTANT: Try to be as helpful as possible, and provide as much information as you can. for example if a user asks what is in their order, you should also tell them the price of the items as well as the total price of the order.",
+    "After every Thought, you must either take an Action or immediately provide a Response.",
+    "If an Action is required, use: Action: <action_name> If no Action is required, use: Final Answer: <your response>",
+    "Never leave a Thought without an Action or a Final Answer. If responding directly, skip 'Action' and use 'Final Answer' immediately.",
+    "Never wrap thoughts in markdown or any other formatting characters.",
+    "When calling view_cart, make sure to include the action input.",
+    "IMPORTANT: If a function returns saying that the json formatting is bad, fix the input before you try again.",
+    "IMPORTANT: JSON inputs should not include any formatting characters like quotes or backticks. Just the JSON itself.",
+    "When displaying multiple items, try to format it in an easy to read manner, giving each item its own line.",
+    "Try to sound as natural as possible, vary your responses, and avoid sounding robotic. Use contractions and casual language when appropriate.",
+    "When asked about items like 'chicken dishes' or 'fish items', only include menu items that fit that description. Do not include items just because they share a category with other items that fit.",
+    "Keep in mind some categories may not be good descriptors for the items in them, for example mcnuggets does not contain the word chicken, but the items in the category are chicken items. If you are unsure if a category contains items you are looking for, check the items in the category to see.",
+    "If a user asks to clear their cart and add items in the same message, clear the cart first then add the items. When this happens let them know you cleared the cart and added the items they wanted.",
+    "Anytime the user places their order, let them know what is in their cart and the total price first, then place the order.",
+]
+
+# Only the ReAct agent needs these, they teach it the text format its replies are parsed from. With native tool calling
+# the model returns structured calls checked against the tool schemas, so they are left out
+REACT_FORMAT_INSTRUCTIONS = {
+    "IMPORTANT: Allways use JSON formatting when taking an action.",
+    "When calling add_combo or remove_combo, the input should be one JSON object with three keys: entree, side, and drink. Each key should contain a dictionary with the item name and modifications. A fourth key, quantity, is optional, if not provided it defaults to one.",
+    "When calling add_items or remove_items, the input should be one JSON object with the key items, a list with one object per item holding item_name, quantity and modifications.",
+    "When providing JSON outputs, return only the raw JSON without any additional formatting characters such as backticks or quotes. Do not wrap JSON responses in markdown or any other formatting.",
+    "IMPORTANT: After each query from the user you must have a thought before you take an action or provide a response. Do not go straight to the action or response.",
+    "IMPORTANT: Never use markdown or any other formatting characters for anything, namely thoughts, actions, action inputs, or jsons.",
+    "After every Thought, you must either take an Action or immediately provide a Response.",
+    "If an Action is required, use: Action: <action_name> If no Action is required, use: Final Answer: <your response>",
+    "Never leave a Thought without an Action or a Final Answer. If responding directly, skip 'Action' and use 'Final Answer' immediately.",
+    "Never wrap thoughts in markdown or any other formatting characters.",
+    "When calling view_cart, make sure to include the action input.",
+    "IMPORTANT: If a function returns saying that the json formatting is bad, fix the input before you try again.",
+    "IMPORTANT: JSON inputs should not include any formatting characters like quotes or backticks. Just the JSON itself.",
+}
+
+TOOL_CALLING_INSTRUCTIONS = [
+    "IMPORTANT: Never use markdown or any other formatting characters in your replies.",
+    "Only say you added, removed or ordered something after the tool for it has returned.",
+]
+
+
+def instructions_for(mode):
+    if mode == "react":
+        return INSTRUCTIONS
+    return [line for line in INSTRUCTIONS if line not in REACT_FORMAT_INSTRUCTIONS] + TOOL_CALLING_INSTRUCTIONS
+
+
+MAX_HISTORY_TOKENS = 6000   # Oldest history is dropped past this, so one long conversation cant blow up the cost of every turn
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English. Asking Gemini to count would cost a round trip per message
+    return math.ceil(len(text) / 4)
+
+
+def message_text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+def compact_menu(menu_items):
+    # One line per category, "Burgers: Big Mac $5.29; Cheeseburger $2.99", about half the tokens of one line per item
+    by_category = {}
+    for item in menu_items:
+        by_category.setdefault(item.get("category", "Uncategorized"), []).append(f"{item['name']} ${item['price']:.2f}")
+    return "\n".join(f"{category}: {'; '.join(items)}" for category, items in by_category.items())
+
+
+class CompiledPrompt:
+    # The rendered system message for one version of the menu plus the token cost of each of its sections
+
+    def __init__(self, menu_items, generation, mode="react"):
+        self.generation = generation
+        instructions = " ".join(instructions_for(mode))
+        menu = compact_menu(menu_items)
+        self.system_message = SystemMessage(instructions + "\n\nMenu (name and price, grouped by category):\n" + menu)
+        self.section_tokens = {"instructions": estimate_tokens(instructions), "menu": estimate_tokens(menu)}
+
+    def fit(self, history, summary="", cart="", max_history_tokens=MAX_HISTORY_TOKENS):
+        # Returns the prompt messages and the token count per section. The history is cut to the budget a whole turn at
+        # a time, newest turns first in line to be kept, so a tool call is never separated from its result. The summary
+        # and cart go after the fixed prefix so they dont break its caching
+        turns = [[]]
+        for message in history:
+            if isinstance(message, HumanMessage) and turns[-1]:
+                turns.append([])
+            turns[-1].append(message)
+
+        kept = []
+        used = 0
+        for turn in reversed(turns):
+            tokens = sum(estimate_tokens(message_text(message)) for message in turn)
+            if kept and used + tokens > max_history_tokens:
+                break # The newest turn is always kept, even on its own it might be over the budget
+            kept[:0] = turn
+            used += tokens
+
+        messages = [self.system_message]
+        if summary:
+            messages.append(SystemMessage("Summary of the earlier conversation: " + summary))
+        messages.extend(kept)
+        messages.append(SystemMessage("The customer's cart right now: " + cart)) # Always current, even if the history about it was folded
+
+        usage = dict(self.section_tokens)
+        usage["summary"] = estimate_tokens(summary)
+        usage["history"] = used
+        usage["cart"] = estimate_tokens(cart)
+        usage["dropped_messages"] = len(history) - len(kept)
+        return messages, usage
+
+
+_compiled = {}  # agent mode -> CompiledPrompt
+_compile_lock = threading.Lock()
+
+
+def compiled_prompt(mode="react"):
+    # Rebuilds the system prompt only when the catalog has reloaded the menu
+    menu_items = menu_catalog.all_items()
+    compiled = _compiled.get(mode)
+    if compiled is not None and compiled.generation == menu_catalog.generation:
+        return compiled
+    with _compile_lock:
+        compiled = _compiled.get(mode)
+        if compiled is None or compiled.generation != menu_catalog.generation:
+            compiled = _compiled[mode] = CompiledPrompt(menu_items, menu_catalog.generation, mode)
+        return compiled
+
+
+class PromptStats:
+    # Keeps the token usage of the last few turns so we can see what each part of the prompt costs
+
+    def __init__(self, size=500):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=size)
+        self.turns = 0
+
+    def record(self, usage):
+        with self._lock:
+            self._recent.append(usage)
+            self.turns += 1
+
+    def snapshot(self):
+        with self._lock:
+            recent = list(self._recent)
+            turns = self.turns
+        if not recent:
+            return {"turns": turns}
+        sections = [key for key in recent[-1] if key != "dropped_messages"]
+        return {
+            "turns": turns,
+            "average_tokens": {key: sum(usage.get(key, 0) for usage in recent) / len(recent) for key in sections},
+            "max_total_tokens": max(sum(usage.get(key, 0) for key in sections) for usage in recent),
+            "last": recent[-1],
+        }
+
+
+prompt_stats = PromptStats()
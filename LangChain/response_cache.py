@@ -0,0 +1,122 @@
+import re
+import threading
+from collections import OrderedDict
+from database import menu_catalog
+
+
+# Questions whose answer only depends on the menu, like "what's in a big mac" or "what drinks do you have", are
+# answered from here once the agent has answered them for the current menu. Anything that could depend on the cart
+# or on earlier messages is never cached
+
+QUESTION_PATTERN = re.compile(
+    r"^(?:what|which|how\s+(?:many|much)|does|do\s+you|is\s+there|are\s+there|tell\s+me\s+about|describe)\b"
+)
+
+# Cart words mean the answer depends on the customer's order, reference words mean it depends on earlier messages
+PERSONAL_WORDS = re.compile(
+    r"\b(?:cart|order|ordered|add|remove|total|price|everything|my|me|i|i'm|i've|we|our|it|its|that|this|those|these|them|they|"
+    r"one|ones|else|same|said|say|first|last)\b"
+)
+
+MENU_TOOLS = {"get_menu_item"} # Tools whose results only depend on the menu
+
+FILLER = re.compile(r"\b(?:please|hey|hi|hello|ronald|so|um|uh)\b")
+
+
+def normalize_question(message):
+    text = message.strip().lower().replace("’", "'")
+    text = re.sub(r"\b(what|who|where|how|that|there)'s\b", r"\1 is", text)
+    text = FILLER.sub(" ", text)
+    text = re.sub(r"[^\w\s'-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def is_cacheable(question):
+    # question is already normalized
+    return bool(QUESTION_PATTERN.match(question)) and not PERSONAL_WORDS.search(question)
+
+
+def answered_from_menu(earlier_turns, summary, cart_empty, tools_called):
+    # Only an answer nothing but the menu went into may be stored: the first turn of the conversation, an empty
+    # cart in the prompt and no tool except menu lookups. Anything else could tell one customer about another's order
+    return not earlier_turns and not summary and cart_empty and set(tools_called) <= MENU_TOOLS
+
+
+class ResponseCache:
+    """
+    Size bounded LRU of agent answers, keyed on the normalized question and the menu they were answered for.
+    The whole cache is dropped every time the catalog reloads the menu.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (menu key, question) -> answer, least recently used first
+        self._menu_key = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0    # questions that were not cacheable in the first place
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _current_menu_key(self):
+        # The catalog's reload counter along with the menu's version. A menu edited straight in Atlas is reloaded through
+        # the change stream without a version bump, so the version alone would keep serving answers about the old menu
+        version = menu_catalog.version # Checks the catalog is fresh first, so the generation below is the current one
+        return (version, menu_catalog.generation)
+
+    def _check_menu(self, menu_key):
+        # Called with the lock held
+        if menu_key != self._menu_key:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._menu_key = menu_key
+
+    def get(self, message):
+        question = normalize_question(message)
+        if not is_cacheable(question):
+            with self._lock:
+                self.skipped += 1
+            return None
+
+        menu_key = self._current_menu_key()
+        with self._lock:
+            self._check_menu(menu_key)
+            answer = self._entries.get((menu_key, question))
+            if answer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((menu_key, question))
+            self.hits += 1
+            return answer
+
+    def put(self, message, answer):
+        question = normalize_question(message)
+        if not answer or not is_cacheable(question):
+            return
+
+        menu_key = self._current_menu_key()
+        with self._lock:
+            self._check_menu(menu_key)
+            self._entries[(menu_key, question)] = answer
+            self._entries.move_to_end((menu_key, question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "skipped": self.skipped,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = ResponseCache()
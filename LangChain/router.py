@@ -0,0 +1,179 @@
+import re
+import threading
+from cart import add_to_cart, remove_from_cart
+from database import menu_catalog
+from sessions import get_session
+
+
+# Fast path for simple commands like "show my cart", "add 2 big macs" or "remove the fries". These are answered
+# straight from the cart functions without calling Gemini. Anything the router is not sure about goes to the agent
+
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+QUANTITY = r"(?:(?P<quantity>\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|the|my)\s+)?"
+
+VIEW_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:(?:show|view|see|check)(?:\s+me)?\s+(?:my|the)\s+(?:cart|order)"
+    r"|what(?:'s|\s+is)\s+in\s+my\s+(?:cart|order))(?:\s+please)?$"
+)
+ADD_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:add|i(?:'ll|\s+will)\s+have|i\s+want|can\s+i\s+(?:get|have))\s+" + QUANTITY +
+    r"(?P<item>.+?)(?:\s+to\s+(?:my|the)\s+(?:cart|order))?(?:\s+please)?$"
+)
+REMOVE_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:remove|delete|take\s+off|take\s+out|drop)\s+" + QUANTITY +
+    r"(?P<item>.+?)(?:\s+(?:from|off|out\s+of)\s+(?:my|the)\s+(?:cart|order))?(?:\s+please)?$"
+)
+
+# If any of these show up the request has modifications, several items or a combo in it, which is the agent's job
+UNSURE_WORDS = re.compile(r"\b(?:and|with|without|no|extra|combo|meal|instead|but|or|then|also|not)\b|[,&]")
+
+
+class RouterStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = {}      # intent -> count
+        self.misses = 0
+
+    def hit(self, intent):
+        with self._lock:
+            self.hits[intent] = self.hits.get(intent, 0) + 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "hits_by_intent": dict(self.hits),
+            }
+
+
+router_stats = RouterStats()
+
+
+def normalize(text):
+    text = text.strip().lower().rstrip(".!?")
+    return re.sub(r"\s+", " ", text)
+
+
+def name_variants(phrase): # "big macs" -> ("big macs", "big mac"), good enough for the plurals people use with menu names
+    variants = [phrase]
+    if phrase.endswith("es"):
+        variants.append(phrase[:-2])
+    if phrase.endswith("s") and not phrase.endswith("ss"):
+        variants.append(phrase[:-1])
+    return variants
+
+
+def parse_quantity(word):
+    if word is None or word in ("the", "my"):
+        return None # No number given
+    if word.isdigit():
+        return int(word)
+    return NUMBERS[word]
+
+
+def find_menu_item(phrase):
+    # Only an exact name match counts, "fries" matches three sizes of fries so the agent has to ask which one
+    items = menu_catalog.all_items()
+    for candidate in name_variants(phrase):
+        matches = [item for item in items if item.get("name", "").lower() == candidate]
+        if len(matches) == 1:
+            return matches[0]
+    return None
+
+
+def find_cart_line(phrase):
+    # Finds the one cart line the phrase refers to, regular items only. More than one match means we are not sure
+    cart = get_session().cart
+    for variant in name_variants(phrase):
+        lines = cart.lines_for(variant) # Exact names come straight from the cart's index
+        if lines:
+            return lines[0] if len(lines) == 1 else None
+    patterns = [re.compile(rf"\b{re.escape(variant)}\b") for variant in name_variants(phrase)]
+    matches = [line for name in cart.by_item if any(pattern.search(name) for pattern in patterns) for line in cart.lines_for(name)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def plural(name, quantity):
+    if quantity == 1 or not name[-1:].isalpha() or name.lower().endswith("s"):
+        return name
+    return f"{name}s"
+
+
+def route_view(match):
+    cart = get_session().cart
+    if not cart:
+        return "Your cart is empty right now. What can I get for you?"
+    return "Here's what's in your cart:\n" + cart.render()
+
+
+def route_add(match):
+    item_phrase = match.group("item")
+    if UNSURE_WORDS.search(item_phrase):
+        return None
+
+    item = find_menu_item(item_phrase)
+    if item is None:
+        return None
+
+    quantity = parse_quantity(match.group("quantity"))
+    if quantity == 0: # "add 0 big macs" is not an order we should guess at, the agent asks what they meant
+        return None
+    quantity = 1 if quantity is None else quantity
+    result = add_to_cart({"item_name": item["name"], "quantity": quantity})
+    if not result.startswith("Added"):
+        return None
+
+    reply = f"Added {quantity} {plural(item['name'], quantity)} to your cart."
+    if item.get("type", "").lower() == "entree": # Same as the agent is told to do, offer the combo after adding an entree
+        reply += " Would you like to make it a combo with a side and a drink?"
+    return reply
+
+
+def route_remove(match):
+    item_phrase = match.group("item")
+    if UNSURE_WORDS.search(item_phrase):
+        return None
+
+    line = find_cart_line(item_phrase)
+    if line is None:
+        return None
+
+    quantity = parse_quantity(match.group("quantity"))
+    in_cart = line.quantity
+    quantity = in_cart if quantity is None else quantity # "remove the fries" takes all of them out
+
+    result = remove_from_cart({"item_name": line.item_id, "quantity": quantity, "modifications": list(line.modifications)})
+    if not result.startswith("Removed"):
+        return None
+
+    removed = min(quantity, in_cart)
+    return f"Removed {removed} {plural(line.name, removed)} from your cart."
+
+
+ROUTES = [("view_cart", VIEW_PATTERN, route_view), ("add_to_cart", ADD_PATTERN, route_add), ("remove_from_cart", REMOVE_PATTERN, route_remove)]
+
+
+def fast_path(message):
+    # Returns a reply if the message is a simple command we handled ourselves, otherwise None so the agent takes over
+    text = normalize(message)
+    session = get_session()
+    with session.lock: # Holds the cart steady between deciding what to do and doing it
+        for intent, pattern, handler in ROUTES:
+            match = pattern.match(text)
+            if match:
+                reply = handler(match)
+                if reply is not None:
+                    router_stats.hit(intent)
+                    return reply
+                break
+
+    router_stats.miss()
+    return None
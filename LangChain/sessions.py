@@ -0,0 +1,98 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from cart_model import Cart
+
+
+# The session the current request belongs to. main.py binds it for every /chat call, and the cart tools read it,
+# so each tool call works on the cart of whoever sent the message
+current_session = contextvars.ContextVar("current_session", default="default")
+
+
+class CartSession:
+    __slots__ = ("session_id", "cart", "lock", "last_used")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.cart = Cart()              # Keeps its own running totals, see cart_model.py
+        self.lock = threading.RLock()   # Held while a tool reads or changes this cart, other sessions are not affected
+        self.last_used = time.monotonic()
+
+
+class _Shard:
+    __slots__ = ("sessions", "lock")
+
+    def __init__(self):
+        self.sessions = OrderedDict()   # session_id -> CartSession, least recently used first
+        self.lock = threading.Lock()
+
+
+class CartStore:
+    """
+    Holds one cart per session. Sessions are spread over a few shards, each with its own lock, so concurrent
+    requests only contend when they land on the same shard, and then only for the dictionary lookup.
+    Carts that have not been touched for ttl seconds, or that fall off the end of a full shard, are evicted.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=3600, shards=16):
+        self._shards = [_Shard() for _ in range(shards)]
+        self._max_per_shard = max(1, max_sessions // shards)
+        self._ttl = ttl
+
+    def _shard(self, session_id):
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def get(self, session_id):
+        shard = self._shard(session_id)
+        now = time.monotonic()
+        with shard.lock:
+            self._evict_expired(shard, now)
+            session = shard.sessions.get(session_id)
+            if session is None:
+                while len(shard.sessions) >= self._max_per_shard:
+                    shard.sessions.popitem(last=False) # Shard is full, drop the least recently used cart
+                session = shard.sessions[session_id] = CartSession(session_id)
+            else:
+                shard.sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def discard(self, session_id):
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.sessions.pop(session_id, None)
+
+    def _evict_expired(self, shard, now):
+        # Oldest sessions sit at the front, so we only ever look at the ones that are actually expiring
+        sessions = shard.sessions
+        while sessions:
+            session = next(iter(sessions.values()))
+            if now - session.last_used < self._ttl:
+                break
+            sessions.popitem(last=False)
+
+    def __len__(self):
+        return sum(len(shard.sessions) for shard in self._shards)
+
+
+cart_store = CartStore()
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def get_session():
+    return cart_store.get(current_session.get()) # The cart session of whoever is making the current request
+
+
+@contextmanager
+def bind_session(session_id):
+    token = current_session.set(session_id)
+    try:
+        yield session_id
+    finally:
+        current_session.reset(token)
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_START = time.perf_counter() # main.py imports this module first, so this is about when our own imports began
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "5")) # How long a cold start may take before we warn about it
+
+
+class StartupReport:
+    """
+    Times each step of a cold start. Steps the server waits on are timed with phase, steps that run after it is
+    already serving are timed with background. ready prints the report and warns when the wait went over the budget.
+    """
+
+    def __init__(self, budget=STARTUP_BUDGET_SECONDS):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self.phases = {}        # name -> seconds, in the order they ran
+        self.background_tasks = {}   # name -> {"seconds", "error"}, filled in as each one finishes
+        self.ready_after = None
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases[name] = round(seconds, 3)
+
+    def imports_done(self):
+        self.record("imports", time.perf_counter() - PROCESS_START)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def background(self, name, func):
+        # Runs func on a daemon thread and records how long it took and whether it failed, startup does not wait for it
+        def run():
+            started = time.perf_counter()
+            error = None
+            try:
+                func()
+            except Exception as e:
+                error = str(e)
+                print(f"Startup task {name} failed:", e)
+            with self._lock:
+                self.background_tasks[name] = {"seconds": round(time.perf_counter() - started, 3), "error": error}
+
+        thread = threading.Thread(target=run, name=f"startup-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def ready(self):
+        self.ready_after = round(time.perf_counter() - PROCESS_START, 3)
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        print(f"Ready to serve after {self.ready_after:.2f}s ({steps})")
+        if self.ready_after > self.budget:
+            print(f"WARNING: startup took longer than the {self.budget:.1f}s budget")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ready_after": self.ready_after,
+                "budget": self.budget,
+                "within_budget": self.ready_after is not None and self.ready_after <= self.budget,
+                "phases": dict(self.phases),
+                "background": {name: dict(task) for name, task in self.background_tasks.items()},
+            }
+
+
+startup_report = StartupReport()
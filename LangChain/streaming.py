@@ -0,0 +1,121 @@
+import json
+from langchain_core.messages import HumanMessage
+from sessions import bind_session
+from telemetry import agent_timer, trace_request
+from tool_memo import tool_turn
+from config import AGENT_MODE
+from llm_scheduler import BUSY_MESSAGE, LLMUnavailable, turn_deadline
+
+
+FINAL_ANSWER = "Final Answer:"
+ACTION_INPUT = "Action Input:"
+
+# What we tell the user while a tool is running, the agent's thoughts are never shown
+TOOL_PROGRESS = {
+    "add_to_cart": "Adding {item}…",
+    "remove_from_cart": "Removing {item}…",
+    "add_items": "Adding {item}…",
+    "remove_items": "Removing {item}…",
+    "view_cart": "Checking your cart…",
+    "get_menu_item": "Looking up {item}…",
+    "add_combo": "Adding a {item} combo…",
+    "remove_combo": "Removing a {item} combo…",
+    "place_order": "Placing your order…",
+}
+
+
+def sse(event): # One Server-Sent Events message, the browser splits the stream on the blank line
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def describe_tool_call(name, tool_input):
+    args = tool_input
+    if isinstance(args, dict) and "input" in args and len(args) == 1:
+        args = args["input"] # Single string tools are reported as {"input": "..."}
+    if isinstance(args, str):
+        try:
+            args = json.loads(args.strip("`"))
+        except json.JSONDecodeError:
+            args = {}
+    if not isinstance(args, dict):
+        args = {}
+
+    item = args.get("item_name") or args.get("category")
+    if not item and isinstance(args.get("entree"), dict):
+        item = args["entree"].get("item_name")
+    if not item and isinstance(args.get("items"), list):
+        names = [entry.get("item_name") for entry in args["items"] if isinstance(entry, dict) and entry.get("item_name")]
+        item = ", ".join(names) if names else None
+
+    template = TOOL_PROGRESS.get(name, "Working on it…")
+    return template.format(item=item or "that")
+
+
+class FinalAnswerFilter:
+    """
+    The ReAct agent streams its whole scratchpad ("Thought: ... Action: ..."). This only lets through what comes
+    after "Final Answer:", which can be split across chunks, so text is buffered until the marker has been seen.
+    With marker=None everything is answer text, that is what the native tool calling model streams.
+    """
+
+    def __init__(self, marker=FINAL_ANSWER):
+        self.marker = marker
+        self._buffers = {}  # run id -> text seen so far, or None once the marker was found and we are passing text through
+        self._started = set() # runs that already sent answer text, until then leading whitespace is dropped
+
+    def feed(self, run_id, text):
+        if self.marker is None:
+            return self._answer_text(run_id, text)
+
+        buffer = self._buffers.get(run_id, "")
+        if buffer is None:
+            return self._answer_text(run_id, text)
+
+        buffer += text
+        index = buffer.find(self.marker)
+        if index == -1:
+            self._buffers[run_id] = buffer
+            return ""
+
+        self._buffers[run_id] = None
+        return self._answer_text(run_id, buffer[index + len(self.marker):])
+
+    def _answer_text(self, run_id, text):
+        if run_id not in self._started:
+            text = text.lstrip()
+            if text:
+                self._started.add(run_id)
+        return text
+
+
+async def stream_chat(app, message, session_id):
+    # Runs one turn through the LangGraph app and yields SSE messages: progress events while tools run, token
+    # events for the final answer as Gemini produces it, and a done event with the full reply
+    config = {"configurable": {"thread_id": session_id}, "callbacks": [agent_timer]}
+    answer_filter = FinalAnswerFilter(FINAL_ANSWER if AGENT_MODE == "react" else None)
+    action_input = None # String tool inputs are not included in tool events, so we take them from the model's "Action Input:" line
+
+    try:
+        with trace_request("/chat/stream", session_id), bind_session(session_id), tool_turn(), turn_deadline():
+            async for event in app.astream_events({"messages": [HumanMessage(message)]}, config, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream" and event.get("metadata", {}).get("langgraph_node") == "model":
+                    text = answer_filter.feed(event["run_id"], event["data"]["chunk"].content or "")
+                    if text:
+                        yield sse({"type": "token", "content": text})
+                elif kind == "on_chat_model_end" and event.get("metadata", {}).get("langgraph_node") == "model":
+                    output = event["data"].get("output")
+                    content = getattr(output, "content", "")
+                    if isinstance(content, str) and ACTION_INPUT in content:
+                        action_input = content.split(ACTION_INPUT, 1)[1].strip()
+                elif kind == "on_tool_start":
+                    tool_input = event["data"].get("input") or action_input
+                    yield sse({"type": "progress", "content": describe_tool_call(event["name"], tool_input)})
+
+        state = await app.aget_state(config)
+        yield sse({"type": "done", "content": state.values["messages"][-1].content, "session_id": session_id})
+    except LLMUnavailable as e:
+        yield sse({"type": "error", "content": BUSY_MESSAGE, "reason": e.reason})
+    except Exception as e:
+        print("Error while streaming:", e)
+        yield sse({"type": "error", "content": "Something went wrong while processing your message. Please try again later."})
@@ -0,0 +1,289 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from pymongo import monitoring
+
+
+# Timing for the hot path. Every /chat request gets a trace, and the LLM calls, tool calls and Mongo operations
+# made while serving it are recorded as spans on that trace. The same timings feed the histograms served at
+# /metrics in the Prometheus text format
+
+SLOW_TURN_SECONDS = float(os.getenv("SLOW_TURN_SECONDS", "5")) # Traces slower than this are printed as one JSON line
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}   # label values -> [count per bucket..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                names = self.labels + ("le",)
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(names, label_values + (bound,))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(names, label_values + ('+Inf',))} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, label_values)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, label_values)} {series[-1]:.6f}")
+        return lines
+
+
+chat_request_seconds = Histogram("chat_request_seconds", "Time to answer one chat message", ("endpoint",))
+chat_requests_total = Counter("chat_requests_total", "Chat messages handled", ("endpoint", "outcome"))
+llm_call_seconds = Histogram("llm_call_seconds", "Time per LLM call")
+llm_errors_total = Counter("llm_errors_total", "LLM calls that raised")
+llm_steps_per_turn = Histogram("llm_steps_per_turn", "LLM calls per chat message that reached the model", buckets=COUNT_BUCKETS)
+llm_tokens_total = Counter("llm_tokens_total", "Tokens reported by the model", ("direction",))
+llm_queue_seconds = Histogram("llm_queue_seconds", "Time LLM calls waited for a free slot in the scheduler")
+llm_retries_total = Counter("llm_retries_total", "LLM calls retried after a transient error")
+llm_rejected_total = Counter("llm_rejected_total", "LLM calls refused by the scheduler", ("reason",))
+agent_parse_errors_total = Counter("agent_parse_errors_total", "Agent replies that could not be parsed and were sent back to the model")
+tool_call_seconds = Histogram("tool_call_seconds", "Time per tool call", ("tool",))
+tool_errors_total = Counter("tool_errors_total", "Tool calls that raised", ("tool",))
+mongo_operation_seconds = Histogram("mongo_operation_seconds", "Time per database layer Mongo operation", ("operation",))
+mongo_command_seconds = Histogram("mongo_command_seconds", "Time per Mongo wire command, from the driver", ("command",))
+mongo_command_failures_total = Counter("mongo_command_failures_total", "Mongo wire commands that failed", ("command",))
+
+METRICS = [
+    chat_request_seconds, chat_requests_total, llm_call_seconds, llm_errors_total, llm_steps_per_turn, llm_tokens_total,
+    llm_queue_seconds, llm_retries_total, llm_rejected_total, agent_parse_errors_total, tool_call_seconds, tool_errors_total, mongo_operation_seconds, mongo_command_seconds,
+    mongo_command_failures_total,
+]
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def session_tag(session_id):
+    # Traces only keep a hash of the session id, the id itself lets whoever has it read and change that customer's cart
+    return hashlib.sha256(session_id.encode()).hexdigest()[:16] if session_id else None
+
+
+class Trace:
+    def __init__(self, endpoint, session_id):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.session = session_tag(session_id)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.seconds = None
+        self.outcome = None
+        self.llm_steps = 0
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, seconds, error=None):
+        with self._lock:
+            self.spans.append({
+                "kind": kind,
+                "name": name,
+                "start_ms": round((time.perf_counter() - seconds - self._started) * 1000, 2),
+                "ms": round(seconds * 1000, 2),
+                "error": error,
+            })
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "endpoint": self.endpoint,
+                "session": self.session,
+                "started_at": self.started_at,
+                "ms": round(self.seconds * 1000, 2) if self.seconds is not None else None,
+                "outcome": self.outcome,
+                "llm_steps": self.llm_steps,
+                "spans": list(self.spans),
+            }
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+recent_traces = deque(maxlen=200)
+
+
+@contextmanager
+def trace_request(endpoint, session_id):
+    trace = Trace(endpoint, session_id)
+    token = current_trace.set(trace)
+    trace.outcome = "error" # Until the body finishes without raising
+    try:
+        yield trace
+        trace.outcome = "ok"
+    finally:
+        current_trace.reset(token)
+        trace.seconds = time.perf_counter() - trace._started
+        chat_request_seconds.observe(trace.seconds, endpoint)
+        chat_requests_total.inc(endpoint, trace.outcome)
+        if trace.llm_steps:
+            llm_steps_per_turn.observe(trace.llm_steps)
+        recent_traces.append(trace)
+        if trace.seconds > SLOW_TURN_SECONDS:
+            print("Slow turn:", json.dumps(trace.to_dict()))
+
+
+def record_span(kind, name, seconds, error=None):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(kind, name, seconds, error)
+
+
+@contextmanager
+def mongo_span(operation):
+    # Wraps one database layer operation, like loading the menu. The driver's own per command timings come from MongoTimer
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        mongo_operation_seconds.observe(seconds, operation)
+        record_span("mongo", operation, seconds, error)
+
+
+def traces(session_id=None):
+    session = session_tag(session_id)
+    return [trace.to_dict() for trace in list(recent_traces) if session is None or trace.session == session]
+
+
+class AgentTimer(BaseCallbackHandler):
+    """
+    LangChain callback that times every LLM and tool call in a run and records them on the request's trace. Passed
+    in the graph's config, so it reaches the agent, the summarizer and the tools.
+    """
+
+    run_inline = True # Called on the event loop in the request's context, so current_trace is the right trace
+
+    def __init__(self):
+        self._started = {}  # run id -> (kind, name, start time)
+
+    def _start(self, run_id, kind, name):
+        self._started[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id, error=None):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return None
+        kind, name, start = started
+        seconds = time.perf_counter() - start
+        record_span(kind, name, seconds, error)
+        return kind, name, seconds
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._llm_start(run_id, serialized)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._llm_start(run_id, serialized)
+
+    def _llm_start(self, run_id, serialized):
+        self._start(run_id, "llm", (serialized or {}).get("name") or "llm")
+        trace = current_trace.get()
+        if trace is not None:
+            trace.llm_steps += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        ended = self._end(run_id)
+        if ended is not None:
+            llm_call_seconds.observe(ended[2])
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    llm_tokens_total.inc("input", amount=usage.get("input_tokens", 0))
+                    llm_tokens_total.inc("output", amount=usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, type(error).__name__)
+        llm_errors_total.inc()
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        if name == "_Exception":
+            agent_parse_errors_total.inc() # handle_parsing_errors sends the parse error back to the model as a fake tool call
+        self._start(run_id, "tool", name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        ended = self._end(run_id)
+        if ended is not None:
+            tool_call_seconds.observe(ended[2], ended[1])
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        ended = self._end(run_id, type(error).__name__)
+        if ended is not None:
+            tool_call_seconds.observe(ended[2], ended[1])
+            tool_errors_total.inc(ended[1])
+
+
+class MongoTimer(monitoring.CommandListener):
+    # Driver level timings for every wire command, registered on the clients in connections.py
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name)
+        mongo_command_failures_total.inc(event.command_name)
+
+
+agent_timer = AgentTimer()
+mongo_timer = MongoTimer()
@@ -0,0 +1,78 @@
+# Runs the app in process against the in-memory Mongo stand-in, with the benchmark's scripted model in place of
+# Gemini. Everything the app writes (checkpoints, the order spool, the menu snapshot) goes to a temporary directory
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from collections import deque
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+os.environ["MONGO_BACKEND"] = "memory"
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("AGENT_MODE", "tools")
+WORKDIR = tempfile.mkdtemp(prefix="chat-tests-")
+os.chdir(WORKDIR)
+
+import langchain_google_genai
+from benchmark import ScriptedChatModel
+langchain_google_genai.ChatGoogleGenerativeAI = ScriptedChatModel # Must happen before agent.py is imported
+
+from config import menu_collection
+from menu import menu_data
+from sessions import bind_session
+
+menu_collection.insert_many([dict(item) for item in menu_data])
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    yield WORKDIR
+    os.chdir(HERE)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def loop():
+    # One loop for the whole run, the scheduler and the catalog keep asyncio objects that belong to the loop they were made on
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def session():
+    # A fresh customer, the cart functions called inside the test work on their cart
+    with bind_session(uuid.uuid4().hex) as session_id:
+        yield session_id
+
+
+@pytest.fixture
+def client(loop):
+    import httpx
+    import main
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.fastapi_app), base_url="http://test")
+    yield client
+    loop.run_until_complete(client.aclose())
+
+
+@pytest.fixture
+def chat(loop, client):
+    # chat(session_id, message, *replies) posts to /chat with the model's replies for the turn and returns the response
+    def send(session_id, message, *replies):
+        ScriptedChatModel.plans[session_id] = deque(replies)
+        return loop.run_until_complete(client.post("/chat", json={"message": message, "session_id": session_id}))
+
+    return send
+
+
+@pytest.fixture
+def get(loop, client):
+    def send(path, **kwargs):
+        return loop.run_until_complete(client.get(path, **kwargs))
+
+    return send
@@ -0,0 +1,55 @@
+import pytest
+from cart import add_combo, add_items, add_to_cart, remove_combo, remove_from_cart, remove_items, view_cart
+from cart_model import Cart
+from sessions import get_session
+
+COMBO = {"entree": {"item_name": "big mac"}, "side": {"item_name": "apple slices"}, "drink": {"item_name": "coca-cola"}}
+
+
+@pytest.mark.parametrize("quantity", [0, -3])
+def test_cart_model_rejects_quantities_below_one(quantity):
+    cart = Cart()
+    with pytest.raises(ValueError):
+        cart.add_item("Big Mac", (), quantity, 529)
+    with pytest.raises(ValueError):
+        cart.add_combo({"entree": ("Big Mac", ()), "side": ("Apple Slices", ()), "drink": ("Coca-Cola (Medium)", ())}, quantity, 700)
+    line = cart.add_item("Big Mac", (), 1, 529)
+    with pytest.raises(ValueError):
+        cart.remove(line, quantity)
+    assert cart.total_cents == 529 and line.quantity == 1
+
+
+@pytest.mark.parametrize("quantity", [0, -3])
+def test_cart_tools_reject_quantities_below_one(session, quantity):
+    assert add_to_cart({"item_name": "big mac", "quantity": quantity}) == "The quantity for big mac must be at least 1."
+    assert add_combo({**COMBO, "quantity": quantity}) == "The quantity for the combo must be at least 1."
+    assert add_items({"items": [{"item_name": "big mac", "quantity": quantity}]}).startswith("Nothing was added: the quantity for big mac must be at least 1")
+    assert view_cart() == "Your shopping cart is empty."
+
+    add_to_cart({"item_name": "big mac"})
+    add_combo(COMBO)
+    before = view_cart()
+    assert remove_from_cart({"item_name": "big mac", "quantity": quantity}) == "The quantity for big mac must be at least 1."
+    assert remove_combo({**COMBO, "quantity": quantity}) == "The quantity for the combo must be at least 1."
+    assert remove_items({"items": [{"item_name": "big mac", "quantity": quantity}]}).startswith("Nothing was removed: the quantity for big mac must be at least 1")
+    assert view_cart() == before
+
+
+def test_modifications_are_stored_with_the_menus_spelling(session):
+    add_items({"items": [{"item_name": "big mac", "modifications": ["No Pickles"]}]})
+    add_items({"items": [{"item_name": "big mac", "modifications": ["no pickles"]}]})
+    add_to_cart({"item_name": "big mac", "modifications": ["NO PICKLES"]})
+    assert view_cart().splitlines()[0] == "3x Big Mac (no pickles) @ $5.29 = $15.87"
+    assert remove_items({"items": [{"item_name": "big mac", "quantity": 3, "modifications": ["No Pickles"]}]}).startswith("Removed")
+    assert view_cart() == "Your shopping cart is empty."
+
+
+def test_lines_keep_the_menus_spelling(session):
+    add_to_cart({"item_name": "BIG MAC"})
+    add_combo(COMBO)
+    assert view_cart().splitlines()[:2] == ["1x Big Mac @ $5.29 = $5.29", "1x combo (Big Mac, Apple Slices, Coca-Cola (Medium)) @ $7.19 = $7.19"]
+    cart = Cart()
+    cart.merge(get_session().cart)
+    item, combo = cart.order_items()
+    assert item["name"] == "Big Mac"
+    assert [part["name"] for part in combo["details"].values()] == ["Big Mac", "Apple Slices", "Coca-Cola (Medium)"]
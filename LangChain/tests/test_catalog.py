@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from catalog import MenuCatalog
+from menu import menu_data
+
+
+class FlakyLoader:
+    # Loads the menu once, then fails like Mongo being down until it is told to recover
+    def __init__(self):
+        self.calls = 0
+        self.down = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("Mongo is down")
+        return list(menu_data), {}
+
+    async def load(self):
+        await asyncio.sleep(0.01) # Like a server selection timeout, only much shorter
+        return self()
+
+
+def test_serves_the_last_menu_when_a_refresh_fails():
+    loader = FlakyLoader()
+    catalog = MenuCatalog(loader, ttl=0)
+    assert catalog.find(item_name="big mac")
+
+    loader.down = True
+    catalog.invalidate()
+    assert [item["name"] for item in catalog.find(item_name="big mac")] == ["Big Mac"]
+    assert catalog.refresh_failures == 1
+
+    calls = loader.calls
+    catalog.find(item_name="fries") # Inside the backoff, Mongo is left alone
+    assert loader.calls == calls
+
+    loader.down = False
+    catalog._retry_at = 0.0 # Backoff over
+    catalog.find(item_name="fries")
+    assert loader.calls == calls + 1 and catalog.refresh_failures == 0
+
+
+def test_async_refresh_failure_serves_the_last_menu():
+    loader = FlakyLoader()
+    catalog = MenuCatalog(loader, ttl=0, async_loader=loader.load)
+
+    async def run():
+        assert await catalog.afind(item_name="big mac")
+        loader.down = True
+        catalog.invalidate()
+        results = await asyncio.gather(*(catalog.afind(item_name="big mac") for _ in range(5)))
+        return [len(items) for items in results]
+
+    assert asyncio.run(run()) == [1] * 5
+    assert catalog.refresh_failures == 1
+
+
+def test_raises_when_nothing_was_ever_loaded():
+    loader = FlakyLoader()
+    loader.down = True
+    catalog = MenuCatalog(loader)
+    with pytest.raises(ConnectionError):
+        catalog.find(item_name="big mac")
+
+
+def test_event_loop_lookups_never_reload_synchronously():
+    loader = FlakyLoader()
+    catalog = MenuCatalog(loader, ttl=0)
+    catalog.find(item_name="big mac")
+    catalog.invalidate()
+
+    async def lookups():
+        # Sync lookups made by code running on the loop, like the cart tools, the router and the prompt
+        return catalog.find(item_name="big mac"), catalog.all_items(), catalog.version, catalog.resolve("bigmac")
+
+    asyncio.run(lookups())
+    assert loader.calls == 1
+    catalog.find(item_name="big mac") # Off the loop the stale menu is reloaded as before
+    assert loader.calls == 2
+
+
+def test_async_cart_tools_refresh_the_menu_first(session, monkeypatch):
+    import cart
+    from database import menu_catalog
+
+    refreshed = []
+
+    async def aensure_fresh():
+        refreshed.append(True)
+
+    monkeypatch.setattr(menu_catalog, "aensure_fresh", aensure_fresh)
+    for tool in [cart.aadd_to_cart, cart.aremove_from_cart, cart.aadd_items, cart.aremove_items, cart.aadd_combo, cart.aremove_combo]:
+        refreshed.clear()
+        asyncio.run(tool({}))
+        assert refreshed, tool.__name__
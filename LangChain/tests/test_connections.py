@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+from conftest import HERE
+
+
+def test_pool_settings_come_from_api_env(tmp_path):
+    # config.py loads API.env from the working directory, the pool settings have to see it
+    (tmp_path / "API.env").write_text("MONGO_MAX_POOL_SIZE=77\nMONGO_OPERATION_MS=1234\n")
+    env = {key: value for key, value in os.environ.items() if not key.startswith("MONGO_") or key == "MONGO_BACKEND"}
+    code = "import config, connections; print(config.mongo.settings['maxPoolSize'], connections.OPERATION_TIMEOUT_MS)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env={**env, "PYTHONPATH": HERE}, capture_output=True, text=True, timeout=60)
+    assert result.stdout.split() == ["77", "1234"], result.stderr
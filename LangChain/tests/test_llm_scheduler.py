@@ -0,0 +1,82 @@
+import asyncio
+import json
+import uuid
+from collections import deque
+import pytest
+from benchmark import ScriptedChatModel, action, final
+from llm_scheduler import CircuitBreaker, DeadlineExceeded, LLMScheduler, turn_deadline
+
+
+class ModelError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def failing(code):
+    async def call():
+        raise ModelError(code)
+    return call
+
+
+def test_bad_requests_do_not_open_the_breaker():
+    scheduler = LLMScheduler(max_attempts=1, breaker=CircuitBreaker(failures=3, cooldown=60))
+
+    async def run():
+        for _ in range(10):
+            with pytest.raises(ModelError):
+                await scheduler.run(failing(400))
+        assert scheduler.breaker.state == "closed"
+        for _ in range(3):
+            with pytest.raises(ModelError):
+                await scheduler.run(failing(503))
+        assert scheduler.breaker.state == "open"
+
+    asyncio.run(run())
+    assert scheduler.stats["failures"] == 13
+
+
+def slow():
+    async def call():
+        await asyncio.sleep(1)
+    return call
+
+
+def test_a_turn_running_out_of_time_does_not_trip_the_breaker():
+    scheduler = LLMScheduler(call_timeout=30, breaker=CircuitBreaker(failures=1, cooldown=60))
+
+    async def run():
+        with turn_deadline(0.05), pytest.raises(DeadlineExceeded):
+            await scheduler.run(slow())
+        with turn_deadline(0.05), pytest.raises(DeadlineExceeded):
+            async for _ in scheduler.stream(slow_chunks):
+                pass
+
+    async def slow_chunks():
+        await asyncio.sleep(1)
+        yield "late"
+
+    asyncio.run(run())
+    assert scheduler.breaker.state == "closed" and scheduler.stats["failures"] == 0
+    assert scheduler.stats["deadline_exceeded"] == 2
+
+
+def test_a_call_timing_out_on_its_own_counts_against_the_breaker():
+    scheduler = LLMScheduler(call_timeout=0.01, max_attempts=1, breaker=CircuitBreaker(failures=1, cooldown=60))
+
+    async def run():
+        with turn_deadline(30), pytest.raises(asyncio.TimeoutError):
+            await scheduler.run(slow())
+
+    asyncio.run(run())
+    assert scheduler.breaker.state == "open"
+
+
+def test_stream_works_with_a_model_that_cannot_stream(loop, client):
+    # The scripted model only implements _generate, the scheduled wrapper has to fall back to one chunk
+    session_id = uuid.uuid4().hex
+    ScriptedChatModel.plans[session_id] = deque([action("view_cart", {}), final("Your cart is empty, what can I get you?")])
+    response = loop.run_until_complete(client.post("/chat/stream", json={"message": "how does my cart look", "session_id": session_id}))
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [event["type"] for event in events if event["type"] != "progress"][-1] == "done", events
+    assert "".join(event["content"] for event in events if event["type"] == "token") == "Your cart is empty, what can I get you?"
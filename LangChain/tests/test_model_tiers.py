@@ -0,0 +1,28 @@
+import os
+import uuid
+import pytest
+from benchmark import action, final
+from model_tiers import tier_stats
+
+pytestmark = pytest.mark.skipif(os.environ["AGENT_MODE"] != "tools", reason="tool errors escalate in tools mode only")
+
+
+def test_a_failed_cart_tool_moves_the_turn_to_the_strong_model(chat):
+    before = tier_stats.snapshot()["escalations_by_reason"].get("tool_error", 0)
+    reply = chat(uuid.uuid4().hex, "i want a mcfoo", action("add_to_cart", {"item_name": "mcfoo"}), final("Sorry, we dont have that."))
+    assert reply.status_code == 200
+    assert tier_stats.snapshot()["escalations_by_reason"].get("tool_error", 0) == before + 1
+
+
+def test_a_cart_change_that_worked_stays_on_the_fast_model(chat):
+    before = tier_stats.snapshot()["escalations"]
+    chat(uuid.uuid4().hex, "i want a cheeseburger please", action("add_to_cart", {"item_name": "cheeseburger"}), final("Added a Cheeseburger."))
+    assert tier_stats.snapshot()["escalations"] == before
+
+
+def test_a_question_for_the_customer_stays_on_the_fast_model(chat):
+    before = tier_stats.snapshot()["escalations"]
+    reply = chat(uuid.uuid4().hex, "i want a big mca", action("add_to_cart", {"item_name": "big mca"}), final("Did you mean a Big Mac?"))
+    assert reply.json()["content"] == "Did you mean a Big Mac?"
+    chat(uuid.uuid4().hex, "i want some chicken", action("add_items", {"items": [{"item_name": "chicken"}]}), final("Which chicken would you like?"))
+    assert tier_stats.snapshot()["escalations"] == before
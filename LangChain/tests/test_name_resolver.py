@@ -0,0 +1,60 @@
+import pytest
+from cart import add_combo, add_items, add_to_cart, view_cart
+from database import get_menu_item, menu_catalog
+from menu import menu_data
+from name_resolver import CONFIDENT_MATCH, NameResolver
+
+resolver = NameResolver(menu_data)
+
+
+def matched(query):
+    return [menu_data[position]["name"] for position in resolver.matches(query)]
+
+
+@pytest.mark.parametrize("query, name", [
+    ("bigmac", "Big Mac"),
+    ("Big Mac burger", "Big Mac"),
+    ("big mca", "Big Mac"),
+    ("coke", "Coca-Cola (Medium)"),
+    ("large fries", "French Fries (Large)"),
+    ("mcchiken", "McChicken"),
+    ("10 pc nuggets", "10 piece Chicken McNuggets"),
+])
+def test_resolves_typos_and_aliases(query, name):
+    assert matched(query) == [name]
+
+
+@pytest.mark.parametrize("query", ["double cheeseburger", "20 piece nuggets", "diet coke", "coke zero", "large coke", "pizza"])
+def test_qualifiers_are_not_ignored(query):
+    assert matched(query) == []
+    assert all(score < CONFIDENT_MATCH for score, _, _ in resolver.resolve(query))
+
+
+@pytest.mark.parametrize("query", ["double cheeseburger", "20 piece nuggets", "diet coke"])
+def test_cart_does_not_add_near_misses(session, query):
+    add_to_cart({"item_name": query})
+    add_items({"items": [{"item_name": "big mac"}, {"item_name": query}]})
+    assert view_cart() == "Your shopping cart is empty."
+
+
+def test_cart_asks_about_unsure_matches(session):
+    reply = add_to_cart({"item_name": "big mca"})
+    assert "Did you mean Big Mac?" in reply
+    assert view_cart() == "Your shopping cart is empty."
+
+    reply = add_to_cart({"item_name": "coke"})
+    assert reply.startswith("Added 1x Coca-Cola (Medium)")
+
+
+def test_cart_asks_which_item_an_ambiguous_name_means(session):
+    reply = add_to_cart({"item_name": "chicken"})
+    assert "Did you mean McChicken, Spicy McChicken or 10 piece Chicken McNuggets?" in reply
+    assert add_items({"items": [{"item_name": "chicken"}]}).startswith("Nothing was added")
+    assert "Did you mean McChicken" in add_combo({"entree": {"item_name": "chicken"}, "side": {"item_name": "fries"}, "drink": {"item_name": "coke"}})
+    assert view_cart() == "Your shopping cart is empty."
+
+
+def test_typo_matches_are_scored_from_the_same_menu(monkeypatch):
+    monkeypatch.setattr(menu_catalog, "resolve", lambda name, limit=3: []) # Like a reload between two separate lookups
+    [item] = get_menu_item({"item_name": "big mca"})
+    assert item["name"] == "Big Mac" and item["match_confidence"] < CONFIDENT_MATCH
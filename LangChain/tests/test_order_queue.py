@@ -0,0 +1,74 @@
+import mongomock
+from pymongo.errors import AutoReconnect
+from order_queue import OrderSpool, OrderWriter
+
+
+class LostAcknowledgement:
+    # Stores the first batch, then fails as if the connection dropped before the reply came back
+    def __init__(self, collection):
+        self.collection = collection
+        self.dropped = False
+
+    def insert_many(self, documents, ordered=True):
+        self.collection.insert_many(documents, ordered=ordered)
+        if not self.dropped:
+            self.dropped = True
+            raise AutoReconnect("connection closed")
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class Rollups:
+    def __init__(self):
+        self.orders = []
+
+    def record(self, orders):
+        self.orders.extend(order["_id"] for order in orders)
+
+
+def order(total_cents):
+    return {"total_cents": total_cents, "items": [{"name": "Big Mac", "quantity": 1}]}
+
+
+def test_an_order_stored_before_a_dropped_connection_is_counted_once():
+    collection = mongomock.MongoClient().db.orders
+    spool, rollups = OrderSpool(), Rollups()
+    writer = OrderWriter(spool, LostAcknowledgement(collection), rollups)
+    first = spool.append(order(529))
+    try:
+        writer.drain()
+    except AutoReconnect:
+        pass
+    assert writer.stats["orders_written"] == 0 and rollups.orders == []
+
+    second = spool.append(order(189))
+    writer.drain() # The first order comes round again as a duplicate
+    writer.drain()
+    assert sorted(rollups.orders) == sorted([first, second])
+    assert writer.stats["orders_written"] == 2
+    assert collection.count_documents({"recorded": True}) == 2 and spool.pending() == 0
+
+
+def test_duplicates_that_were_already_recorded_are_skipped():
+    collection = mongomock.MongoClient().db.orders
+    spool, rollups = OrderSpool(), Rollups()
+    writer = OrderWriter(spool, collection, rollups)
+    order_id = spool.append(order(529))
+    writer.drain()
+    spool.append({**order(529), "_id": order_id}) # Redelivered after the spool file was written but not yet removed
+    writer.drain()
+    assert rollups.orders == [order_id] and writer.stats["orders_written"] == 1
+
+
+def test_only_one_worker_drains_the_spool():
+    collection = mongomock.MongoClient().db.orders
+    spool = OrderSpool()
+    other_worker = OrderWriter(OrderSpool(), collection)
+    spool.append(order(529))
+    with spool.draining() as ours:
+        assert ours
+        other_worker.drain() # Has to leave the files to the worker that holds the drain lock
+        assert collection.count_documents({}) == 0 and spool.pending() == 1
+    other_worker.drain()
+    assert collection.count_documents({}) == 1 and spool.pending() == 0
@@ -0,0 +1,51 @@
+import uuid
+from benchmark import action, final
+from cart_model import to_cents
+from database import menu_catalog
+from response_cache import ResponseCache, is_cacheable, normalize_question
+from sessions import bind_session, get_session
+
+
+def test_menu_answer_is_shared(chat):
+    first = chat(uuid.uuid4().hex, "What is in a Filet-O-Fish?", action("get_menu_item", {"item_name": "filet-o-fish"}), final("Fish, tartar sauce and cheese."))
+    second = chat(uuid.uuid4().hex, "What is in a Filet-O-Fish?") # No replies, the cache has to answer
+    assert first.json()["content"] == second.json()["content"] == "Fish, tartar sauce and cheese."
+
+
+def test_cart_answer_is_not_shared(chat):
+    customer, other = uuid.uuid4().hex, uuid.uuid4().hex
+    with bind_session(customer):
+        get_session().cart.add_item("Sprite (Medium)", (), 1, to_cents(1.99))
+    chat(customer, "Which drinks are there?", final("You already have a Sprite, we also have Coca-Cola and Iced Coffee."))
+    reply = chat(other, "Which drinks are there?", final("We have Coca-Cola, Sprite and Iced Coffee."))
+    assert reply.json()["content"] == "We have Coca-Cola, Sprite and Iced Coffee."
+
+
+def test_later_turns_are_not_shared(chat):
+    customer, other = uuid.uuid4().hex, uuid.uuid4().hex
+    chat(customer, "add a big mac", action("add_to_cart", {"item_name": "big mac"}), final("Added a Big Mac."))
+    chat(customer, "Which burgers are there?", final("Besides your Big Mac we have the Quarter Pounder and the Cheeseburger."))
+    reply = chat(other, "Which burgers are there?", final("We have the Big Mac, the Quarter Pounder and the Cheeseburger."))
+    assert reply.json()["content"] == "We have the Big Mac, the Quarter Pounder and the Cheeseburger."
+
+
+def test_view_cart_answers_are_not_shared(chat):
+    customer, other = uuid.uuid4().hex, uuid.uuid4().hex
+    chat(customer, "How many items are there?", action("view_cart", {}), final("Your cart is empty."))
+    reply = chat(other, "How many items are there?", final("There are 15 items on the menu."))
+    assert reply.json()["content"] == "There are 15 items on the menu."
+
+
+def test_questions_about_the_conversation_are_not_cacheable():
+    for question in ["What's the total?", "how much is everything", "what did you say", "what was the first thing", "what was the last one"]:
+        assert not is_cacheable(normalize_question(question)), question
+
+
+def test_a_reload_without_a_version_bump_clears_the_cache(monkeypatch):
+    monkeypatch.setattr(menu_catalog, "_version_loader", lambda: "v1")
+    menu_catalog.refresh()
+    cache = ResponseCache()
+    cache.put("What is in a Big Mac?", "Two beef patties.")
+    assert cache.get("What is in a Big Mac?") == "Two beef patties."
+    menu_catalog.refresh() # Like a change stream event after an edit in Atlas that left the version alone
+    assert cache.get("What is in a Big Mac?") is None
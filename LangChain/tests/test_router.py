@@ -0,0 +1,17 @@
+import pytest
+from cart import view_cart
+from router import fast_path
+
+
+@pytest.mark.parametrize("message", ["add 0 big macs", "add 00 big macs", "remove 0 big macs"])
+def test_zero_quantities_go_to_the_agent(session, message):
+    if message.startswith("remove"):
+        assert fast_path("add a big mac") == "Added 1 Big Mac to your cart. Would you like to make it a combo with a side and a drink?"
+    before = view_cart()
+    assert fast_path(message) is None
+    assert view_cart() == before
+
+
+def test_missing_quantity_adds_one(session):
+    assert fast_path("add big mac").startswith("Added 1 Big Mac to your cart.")
+    assert view_cart().splitlines()[0] == "1x Big Mac @ $5.29 = $5.29"
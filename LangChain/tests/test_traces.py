@@ -0,0 +1,34 @@
+import uuid
+import main
+from benchmark import final
+
+
+def test_traces_are_off_without_a_token(get, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert get("/traces").status_code == 404
+
+
+def test_traces_need_the_admin_token(get, chat, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    session_id = uuid.uuid4().hex
+    chat(session_id, "hello there", final("Hi!"))
+
+    assert get("/traces").status_code == 403
+    assert get("/traces", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    response = get("/traces", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert session_id not in response.text
+
+    mine = get("/traces", params={"session_id": session_id}, headers={"X-Admin-Token": "secret"}).json()
+    assert len(mine) == 1 and mine[0]["session"]
+
+
+def test_sales_need_the_admin_token(get, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert get("/analytics/sales").status_code == 404
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert get("/analytics/sales").status_code == 403
+    response = get("/analytics/sales", params={"period": "day"}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200 and response.json()["period"] == "day"
@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# Within one agent turn the same read only lookup often runs several times, the agent repeats a get_menu_item call
+# or looks up an item that add_to_cart just looked up itself. While a turn is active these calls are answered from
+# the turn's memo. Keys start with their scope, "menu" results hold for the whole turn and "cart" results are
+# dropped by every tool that changes the cart
+
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class TurnMemo:
+    def __init__(self):
+        self.results = {}
+        self.pending = {}   # key -> task for async calls still running, so identical concurrent calls share one
+        self.calls = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+
+    def call(self, key, func, *args):
+        with self._lock:
+            self.calls += 1
+            if key in self.results:
+                self.saved += 1
+                return self.results[key]
+        result = func(*args)
+        with self._lock:
+            self.results[key] = result
+        return result
+
+    async def acall(self, key, coroutine, *args):
+        with self._lock:
+            self.calls += 1
+            if key in self.results:
+                self.saved += 1
+                return self.results[key]
+            task = self.pending.get(key)
+            if task is not None:
+                self.saved += 1
+            else:
+                task = self.pending[key] = asyncio.ensure_future(coroutine(*args))
+        try:
+            result = await asyncio.shield(task) # One caller being cancelled must not cancel the lookup for the others
+        finally:
+            with self._lock:
+                if self.pending.get(key) is task:
+                    del self.pending[key]
+        with self._lock:
+            self.results[key] = result
+        return result
+
+    def invalidate(self, scope):
+        with self._lock:
+            for key in [key for key in self.results if key[0] == scope]:
+                del self.results[key]
+
+
+def turn_call(key, func, *args):
+    # Runs func(*args) through the current turn's memo, or directly outside a turn or when key is None
+    memo = current_turn.get()
+    if memo is None or key is None:
+        return func(*args)
+    return memo.call(key, func, *args)
+
+
+async def aturn_call(key, coroutine, *args):
+    memo = current_turn.get()
+    if memo is None or key is None:
+        return await coroutine(*args)
+    return await memo.acall(key, coroutine, *args)
+
+
+def invalidate_turn(scope):
+    memo = current_turn.get()
+    if memo is not None:
+        memo.invalidate(scope)
+
+
+def memoized(func, coroutine, key_for):
+    # Read only tool, returns the sync and async functions to hand to Tool. key_for maps the tool input to a memo key
+    def run(args=None):
+        return turn_call(key_for(args), func, args)
+
+    async def arun(args=None):
+        return await aturn_call(key_for(args), coroutine, args)
+
+    return run, arun
+
+
+def changes_cart(func, coroutine):
+    # Tool that changes the cart, anything the turn remembered about the cart is dropped after it runs
+    def run(args=None):
+        try:
+            return func(args)
+        finally:
+            invalidate_turn("cart")
+
+    async def arun(args=None):
+        try:
+            return await coroutine(args)
+        finally:
+            invalidate_turn("cart")
+
+    return run, arun
+
+
+class ToolMemoStats:
+    def __init__(self, size=500):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=size)  # (calls, saved) per turn
+        self.turns = 0
+        self.calls = 0
+        self.saved = 0
+
+    def record(self, memo):
+        with self._lock:
+            self._recent.append((memo.calls, memo.saved))
+            self.turns += 1
+            self.calls += memo.calls
+            self.saved += memo.saved
+
+    def snapshot(self):
+        with self._lock:
+            recent = list(self._recent)
+            return {
+                "turns": self.turns,
+                "lookups": self.calls,
+                "saved_calls": self.saved,
+                "saved_per_turn": self.saved / self.turns if self.turns else 0.0,
+                "last_turn": {"lookups": recent[-1][0], "saved_calls": recent[-1][1]} if recent else None,
+            }
+
+
+tool_memo_stats = ToolMemoStats()
+
+
+@contextmanager
+def tool_turn():
+    # One agent turn, the memo is dropped and its counts recorded when the turn ends
+    memo = TurnMemo()
+    token = current_turn.set(memo)
+    try:
+        yield memo
+    finally:
+        current_turn.reset(token)
+        tool_memo_stats.record(memo)
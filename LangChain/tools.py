@@ -1,24 +1,56 @@
+from typing import List, Optional
 from langchain_community.tools import Tool
-from database import get_menu_item
-from cart import add_to_cart, remove_from_cart, view_cart, add_combo, remove_combo, place_order
+from langchain_core.tools import StructuredTool, ToolException
+from pydantic import BaseModel, Field
+from database import get_menu_item, aget_menu_item, menu_query_key
+from cart import add_to_cart, remove_from_cart, add_items, remove_items, view_cart, add_combo, remove_combo, place_order
+from cart import aadd_to_cart, aremove_from_cart, aadd_items, aremove_items, aview_cart, aadd_combo, aremove_combo, aplace_order
+from cart import CHECK_WITH_CUSTOMER
+from tool_memo import changes_cart, memoized
 
+# Each tool also gets a coroutine, the async agent uses those so no tool call blocks the event loop
+
+# Read only tools are memoized for the length of an agent turn, tools that change the cart clear what the turn knew about it
+get_menu_item, aget_menu_item = memoized(get_menu_item, aget_menu_item, menu_query_key)
+view_cart, aview_cart = memoized(view_cart, aview_cart, lambda args: ("cart", "view"))
+add_to_cart, aadd_to_cart = changes_cart(add_to_cart, aadd_to_cart)
+remove_from_cart, aremove_from_cart = changes_cart(remove_from_cart, aremove_from_cart)
+add_items, aadd_items = changes_cart(add_items, aadd_items)
+remove_items, aremove_items = changes_cart(remove_items, aremove_items)
+add_combo, aadd_combo = changes_cart(add_combo, aadd_combo)
+remove_combo, aremove_combo = changes_cart(remove_combo, aremove_combo)
+place_order, aplace_order = changes_cart(place_order, aplace_order)
 
 add_item_tool = Tool(
     "add_to_cart", 
     add_to_cart,
-    "Adds an item to the cart. When adding multiple different items, add them one at a time. When adding an item with modifications, include the modifications make sure the modification is possible by referencing the list of available modifications for that item.")
+    "Adds an item to the cart. When adding several different items, use add_items instead. When adding an item with modifications, include the modifications make sure the modification is possible by referencing the list of available modifications for that item.",
+    coroutine=aadd_to_cart)
 remove_item_tool = Tool(
     "remove_from_cart", 
     remove_from_cart, 
-    "Removes an item from the cart.")
+    "Removes an item from the cart.",
+    coroutine=aremove_from_cart)
+add_items_tool = Tool(
+    "add_items",
+    add_items,
+    "Adds several items to the cart in one call. The input is one JSON object with the key items, a list of objects each with item_name, quantity and modifications. Nothing is added if any item or modification is not on the menu.",
+    coroutine=aadd_items)
+remove_items_tool = Tool(
+    "remove_items",
+    remove_items,
+    "Removes several items from the cart in one call. The input is one JSON object with the key items, a list of objects each with item_name, quantity and modifications. Nothing is removed if any item is not in the cart.",
+    coroutine=aremove_items)
 view_cart_tool = Tool(
     "view_cart",
     view_cart, 
-    "Displays the shopping cart.")
+    "Displays the shopping cart.",
+    coroutine=aview_cart)
 get_menu_item_tool = Tool(
     "get_menu_item",
     get_menu_item,
-    "Retrieves menu items based on search criteria. Supports item_name (string), category (string), and max_calories (integer). Use this tool to look up information on menu items")
+    "Retrieves menu items based on search criteria. Supports item_name (string), category (string), and max_calories (integer). Use this tool to look up information on menu items",
+    coroutine=aget_menu_item)
 add_combo_tool = Tool( # maybe need to revise the description for this and remove combo, sometimes the agent formats the input wrong, but we cant give an explicit example, it breaks the description
     "add_combo",
     add_combo,
@@ -31,7 +63,8 @@ add_combo_tool = Tool( # maybe need to revise the description for this and remov
         "- Drink and any modifications "
         "- Quantity of the combo to add "
         "You should format the input on one line"
-    ))
+    ),
+    coroutine=aadd_combo)
 remove_combo_tool = Tool(
     "remove_combo",
     remove_combo,
@@ -44,11 +77,95 @@ remove_combo_tool = Tool(
         "- Quantity of the combo to remove "
         "You should format the input on one line"
         "The input should consist of 3 dictionaries, one for each item in the combo, with each containing for example \"item_name\": \"Big Mac\", \"modifications\": []"
-    ))
+    ),
+    coroutine=aremove_combo)
 place_order_tool = Tool(
     "place_order",
     place_order,
-    "Places an order with the items in the cart. The order will be stored in the database.")
+    "Places an order with the items in the cart. The order will be stored in the database.",
+    coroutine=aplace_order)
+
+
+tools = [add_item_tool, remove_item_tool, add_items_tool, remove_items_tool, view_cart_tool, get_menu_item_tool, add_combo_tool, remove_combo_tool, place_order_tool]
+
+# Typed versions of the same tools for native function calling. Gemini gets a JSON schema for each one and returns
+# structured arguments, so there is no text format for it to get wrong. Each tool still calls the function above with
+# one dict, the same thing the ReAct agent's JSON input turns into
+
+class MenuQuery(BaseModel):
+    item_name: str = Field("", description="Full or partial item name, e.g. big mac")
+    category: str = Field("", description="Exact menu category, e.g. burgers")
+    max_calories: Optional[int] = Field(None, description="Only items with at most this many calories")
+
+class CartItem(BaseModel):
+    item_name: str = Field(description="Menu item name")
+    quantity: int = Field(1, ge=1)
+    modifications: List[str] = Field(default_factory=list, description="Changes from the item's list of available modifications")
+
+class CartItems(BaseModel):
+    items: List[CartItem] = Field(min_length=1)
+
+class ComboItem(BaseModel):
+    item_name: str = Field(description="Menu item name")
+    modifications: List[str] = Field(default_factory=list)
+
+class Combo(BaseModel):
+    entree: ComboItem
+    side: ComboItem
+    drink: ComboItem
+    quantity: int = Field(1, ge=1)
+
+class NoArguments(BaseModel):
+    pass
+
+
+def _plain(kwargs):
+    # Nested arguments arrive as models, the cart functions expect plain dicts
+    return {key: _dump(value) for key, value in kwargs.items()}
+
+def _dump(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, list):
+        return [_dump(entry) for entry in value]
+    return value
+
+# The cart functions report a failure as a sentence for the agent to pass on, so a result from a tool that changes the
+# cart is a failure unless it starts with one of these or is a question for the customer ("Did you mean ...?").
+# Failures are raised as ToolException, which gives the ToolMessage status="error" and moves a fast turn to the
+# strong model (see model_tiers.turn_failure)
+CART_SUCCESS = ("Added", "Removed", "Order placed")
+
+def _checked(result):
+    if isinstance(result, str) and not result.startswith(CART_SUCCESS) and not result.endswith(CHECK_WITH_CUSTOMER):
+        raise ToolException(result)
+    return result
+
+def _structured(name, func, coroutine, description, schema, checked=True):
+    check = _checked if checked else (lambda result: result)
+
+    async def run(**kwargs):
+        return check(await coroutine(_plain(kwargs)))
+
+    return StructuredTool.from_function(
+        func=lambda **kwargs: check(func(_plain(kwargs))),
+        coroutine=run,
+        name=name,
+        description=description,
+        args_schema=schema,
+        handle_tool_error=True, # The failure goes back to the model as the tool's answer, same text as before
+    )
+
 
 
-tools = [add_item_tool, remove_item_tool, view_cart_tool, get_menu_item_tool, add_combo_tool, remove_combo_tool, place_order_tool]
\ No newline at end of file
+structured_tools = [
+    _structured("add_to_cart", add_to_cart, aadd_to_cart, "Adds one item to the cart. For several different items use add_items.", CartItem),
+    _structured("remove_from_cart", remove_from_cart, aremove_from_cart, "Removes an item from the cart, the modifications must match the cart line.", CartItem),
+    _structured("add_items", add_items, aadd_items, "Adds several items to the cart in one call. Nothing is added if any item or modification is not on the menu.", CartItems),
+    _structured("remove_items", remove_items, aremove_items, "Removes several items from the cart in one call. Nothing is removed if any item is not in the cart.", CartItems),
+    _structured("view_cart", view_cart, aview_cart, "Shows the cart with the price of each line and the total.", NoArguments, checked=False),
+    _structured("get_menu_item", get_menu_item, aget_menu_item, "Searches the menu by name, category or calories and returns the full details of matching items.", MenuQuery, checked=False),
+    _structured("add_combo", add_combo, aadd_combo, "Adds a combo of one entree, one side and one drink to the cart, at a 10% discount.", Combo),
+    _structured("remove_combo", remove_combo, aremove_combo, "Removes a combo from the cart, the three items and their modifications must match the combo in the cart.", Combo),
+    _structured("place_order", place_order, aplace_order, "Places the order with everything in the cart.", NoArguments),
+]
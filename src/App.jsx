@@ -2,22 +2,78 @@ import { useEffect, useRef, useState } from 'react'
 import { Header } from './components/Header.jsx'
 import { Chatbar } from './components/Chatbar.jsx'
 import { Messagelist } from './components/Messagelist.jsx'
-import axios from 'axios'
 import './App.css'
 
 function App() {
   const [messages, setMessages] = useState([]);
   const messagesEndRef = useRef(null);
+  const sessionId = useRef(sessionStorage.getItem("sessionId"));
+  const nextReplyId = useRef(0);
   const introMessage = "Hello! Ronald is an AI chatbot that is able to take your order and answer any questions about the menu using text or speech.";
+  const errorMessage = "Something went wrong while processing your message. Please try again later.";
+  // Replaces the text of one reply bubble. Found by its id, the customer may have sent another message since it was added
+  const updateReply = (reply, text) => {
+    setMessages((previous) => previous.map((msg) => msg.replyId === reply.id ? {...msg, text: text} : msg));
+  };
+
+  const handleEvent = (event, reply) => {
+    if (event.type === "progress" && !reply.text) {
+      updateReply(reply, event.content);
+    }
+    else if (event.type === "token") {
+      reply.text += event.content;
+      updateReply(reply, reply.text);
+    }
+    else if (event.type === "done" || event.type === "error") {
+      reply.text = event.content;
+      updateReply(reply, event.content);
+      if (event.session_id) {
+        sessionId.current = event.session_id;
+        sessionStorage.setItem("sessionId", event.session_id);
+      }
+    }
+  };
+
   const sendMessage = async (message) => {
+    const reply = {id: nextReplyId.current++, text: ""};
+    setMessages((previous) => [...previous, {text: "", type: "received", replyId: reply.id}]);
     try {
-      const response = await axios.post("/chat", {message: message});
-      const newMessage = response.data.content;
+      const response = await fetch("/chat/stream", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({message: message, session_id: sessionId.current}),
+      });
+      if (!response.ok) {
+        // Not a stream, the server refused the message (503 when the model is busy) or failed before it started
+        const body = await response.json().catch(() => ({}));
+        updateReply(reply, typeof body.error === "string" ? body.error : errorMessage);
+        return;
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
 
-      setMessages([...messages, {text: newMessage, type: "received"}]);
+      while (true) {
+        const {done, value} = await reader.read();
+        if (done) {
+          break;
+        }
+        buffer += decoder.decode(value, {stream: true});
+        const events = buffer.split("\n\n");
+        buffer = events.pop(); // The last piece might be an incomplete event, keep it for the next read
+        for (const event of events) {
+          if (event.startsWith("data: ")) {
+            handleEvent(JSON.parse(event.slice(6)), reply);
+          }
+        }
+      }
 
+      if (!reply.text) {
+        updateReply(reply, errorMessage); // The stream ended without a reply
+      }
     } catch (error) {
       console.error("Error sending message:", error);
+      updateReply(reply, reply.text ? `${reply.text}\n\n${errorMessage}` : errorMessage); // Keep what already arrived
     }
   };
 